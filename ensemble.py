@@ -0,0 +1,120 @@
+import sys, os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from fluctana import *
+
+# ensemble averages of cross spectra over many (shot, trange) windows
+# each window gives partial sums (sp.CrossSpec); partial sums are merged in any order
+#
+# HOW TO RUN over nodes
+# jobs.pkl : dict of 'jobs' [(shot, trange), ...], 'clist1', 'clist2', 'dclass' and 'kwargs' of stream_spec
+# ./python3 ensemble.py run jobs.pkl 0 4 8 part0.pkl  (part 0 of 4 parts with 8 processes on each node)
+# ./python3 ensemble.py reduce part0.pkl part1.pkl part2.pkl part3.pkl merged.pkl
+#
+# acc = sp.load_cross_spec('merged.pkl')
+# cross power, coherence, cross phase on acc.ax over acc.n bins
+# Cxy, Gxy, Axy = acc.values()
+
+def window_spec(job):
+    # IN : (data class, shot, trange, ref channel list, cmp channel list (None for auto spectra), kwargs of stream_spec)
+    # OUT : CrossSpec of the window; None if the data of the window cannot be read (missing file or node)
+    # other errors (arguments, mismatched spectra) are raised
+    dclass, shot, trange, clist1, clist2, kwargs = job
+    tchunk = kwargs.get('tchunk', 0.1)
+
+    try:
+        A = FluctAna()
+        A.add_data(dclass(shot=shot, clist=clist1), trange=[trange[0], min(trange[1], trange[0] + tchunk)], verbose=0)
+        if clist2 is None:
+            dtwo = 0
+        else:
+            A.add_data(dclass(shot=shot, clist=clist2), trange=[trange[0], min(trange[1], trange[0] + tchunk)], verbose=0)
+            dtwo = 1
+
+        A.stream_spec(done=0, dtwo=dtwo, trange=trange, **kwargs)
+        acc = A.Dlist[dtwo].cspec
+    except (OSError, KeyError) as e:
+        print('#### shot {:d} [{:g}, {:g}] is skipped : {} ####'.format(shot, trange[0], trange[1], e))
+        acc = None
+
+    return acc
+
+
+def ensemble_spec(jobs, clist1, clist2=None, dclass=KstarEcei, nproc=1, **kwargs):
+    # IN : list of (shot, trange), ref and cmp channel lists, data class, number of processes, kwargs of stream_spec
+    # OUT : merged CrossSpec of all windows
+    tasks = [(dclass, shot, trange, clist1, clist2, kwargs) for shot, trange in jobs]
+
+    if nproc > 1:
+        with ProcessPoolExecutor(max_workers=nproc) as pool:
+            acc, nskip = merge_windows(pool.map(window_spec, tasks), len(tasks))
+    else:
+        acc, nskip = merge_windows(map(window_spec, tasks), len(tasks))
+
+    if nskip > 0:
+        print('#### {:d} of {:d} windows are skipped ####'.format(nskip, len(tasks)))
+
+    return acc
+
+
+def merge_windows(results, wnum):
+    # IN : CrossSpec (or None) of windows, number of windows
+    # OUT : merged CrossSpec, number of skipped windows
+    acc = None
+    nskip = 0
+    for i, part in enumerate(results):
+        if part is None:
+            nskip += 1
+            continue
+        if acc is None:
+            acc = part
+        else:
+            acc.merge(part)
+        print('ensemble {:d}/{:d} windows; {:d} bins in total'.format(i+1, wnum, acc.n))
+
+    return acc, nskip
+
+
+def run_part(fname, part, nparts, nproc, oname):
+    # IN : job file, part number of nparts, number of processes, output file of the partial sums
+    with open(fname, 'rb') as f:
+        job = pickle.load(f)
+
+    jobs = job['jobs'][part::nparts]
+    acc = ensemble_spec(jobs, job['clist1'], job.get('clist2'), job.get('dclass', KstarEcei), nproc, **job.get('kwargs', {}))
+
+    if acc is None:
+        print('#### no window in part {:d} ####'.format(part))
+    else:
+        acc.save(oname)
+        print('part {:d}/{:d} saved in {:s}'.format(part, nparts, oname))
+
+
+def reduce_parts(fnames, oname):
+    # IN : files of partial sums, output file of the merged sums
+    acc = None
+    for fname in fnames:
+        if not os.path.exists(fname):
+            print('#### {:s} is missing ####'.format(fname))
+            continue
+        part = sp.load_cross_spec(fname)
+        if acc is None:
+            acc = part
+        else:
+            acc.merge(part)
+
+    if acc is not None:
+        acc.save(oname)
+        print('{:d} parts merged in {:s}; {:d} bins in total'.format(len(fnames), oname, acc.n))
+
+    return acc
+
+
+if __name__ == '__main__':
+    if sys.argv[1] == 'run':
+        run_part(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]), int(sys.argv[5]), sys.argv[6])
+    elif sys.argv[1] == 'reduce':
+        reduce_parts(sys.argv[2:-1], sys.argv[-1])
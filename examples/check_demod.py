@@ -0,0 +1,35 @@
+import sys, os
+sys.path.append(os.pardir)
+from fluctana import *
+
+# HOW TO RUN
+# ./python3 check_demod.py 10186 [15.9,16] ECEI_L1303-1403 ECEI_L1403-1503 [13,17]
+
+shot = int(sys.argv[1]) 
+trange = eval(sys.argv[2]) 
+clist1 = sys.argv[3].split(',') 
+clist2 = sys.argv[4].split(',') 
+flimits = eval(sys.argv[5]) # [kHz]
+
+# call fluctana
+A = FluctAna()
+
+# add data
+A.add_data(KstarEcei(shot=shot, clist=clist1), trange=trange, norm=1)
+A.add_data(KstarEcei(shot=shot, clist=clist2), trange=trange, norm=1)
+
+# list data
+A.list_data()
+
+# complex demodulation of the flimits band; data are decimated to a complex signal
+A.demod(dnum=0, fL=flimits[0]*1000.0, fH=flimits[1]*1000.0)
+A.demod(dnum=1, fL=flimits[0]*1000.0, fH=flimits[1]*1000.0)
+
+# do fft; full = 1 for the complex signal. frequency axis is shifted back to the flimits band
+A.fftbins(nfft=64,window='hann',overlap=0.5,detrend=0,full=1)
+
+# calculate coherence using data sets done and dtwo. results are saved in A.Dlist[dtwo].val
+A.coherence(done=0,dtwo=1)
+
+# plot the results; dnum = data set number, cnl = channel number list to plot
+A.mplot(dnum=1,cnl=range(len(A.Dlist[1].clist)),type='val',ylimits=[0,1])
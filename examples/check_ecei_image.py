@@ -17,9 +17,8 @@ def play(shot, trange, dname, flimits=[0,20], vlimits=[-0.1,0.1]):
     clist = ['ECEI_{:s}0101-2408'.format(dname)]
     A.add_data(KstarEcei(shot, clist), trange, norm=1)
 
-    # FIR band pass filter  # OK
-    A.filt(0,'FIR_pass',flimits[0]*1000.0,0,0.01) # smaller b is sharper
-    A.filt(0,'FIR_pass',0,flimits[1]*1000.0,0.01) # smaller b is sharper
+    # FIR band pass filter (high pass and low pass in a single kernel)  # OK
+    A.filt(0,'FIR_pass',flimits[0]*1000.0,flimits[1]*1000.0,0.01) # smaller b is sharper
 
     # you can also try SVD filter
     # A.svd_filt(0, cutoff=0.9)
@@ -27,5 +26,8 @@ def play(shot, trange, dname, flimits=[0,20], vlimits=[-0.1,0.1]):
     # A.iplot(dnum=0,snum=0,vlimits=[-0.1,0.1],istep=0.002,imethod='cubic',cutoff=0.03,pmethod='scatter')
     A.iplot(dnum=0,snum=0,vlimits=vlimits)
 
+    # or render an offscreen movie over processes (frames in ./ecei_{shot}/, video by ffmpeg)
+    # A.movie(dnum=0,fname='ecei_{:d}.mp4'.format(shot),tstep=10,vlimits=vlimits,nproc=8)
+
 if __name__ == "__main__":
     play(shot=22289,trange=[8.2,8.3],dname='GT',flimits=[13,17],vlimits=[-0.05,0.05])
\ No newline at end of file
@@ -27,13 +27,15 @@ plt.plot( A.Dlist[0].ax/1000.0, A.Dlist[0].val[0,:].real )
 # high pass filter; 10000 < f
 # A.filt(0,'FIR_pass',100000,0,b=0.01,verbose=0)
 
-# band pass filter; 5000 < f < 50000
-# A.filt(0,'FIR_pass',50000,0,b=0.01,verbose=0) 
-# A.filt(0,'FIR_pass',0,500000,b=0.01,verbose=0) 
+# band pass filter; 50000 < f < 500000
+# A.filt(0,'FIR_pass',50000,500000,b=0.01,verbose=0) 
 
 # band block filter; f < 50000 and f > 150000
 # A.filt(0,'FIR_block',50000,150000,0.01,verbose=0) # smaller b is sharper
 
+# zero phase IIR band pass filter; 50000 < f < 500000 (ftype = 'butter', 'cheby1', 'cheby2', 'ellip')
+# A.filt(0,'IIR_pass',50000,500000,ftype='ellip',order=4)
+
 
 ## you can also try to use A.svd_filt 
 # A.svd_filt(0, cutoff=0.9)
@@ -10,6 +10,7 @@
 #  2018.12.15 : version 0.10;
 
 import numpy as np
+from scipy import signal
 import h5py
 import pywt
 
@@ -17,6 +18,11 @@ import matplotlib.pyplot as plt
 
 import stats as st
 
+# FIR filter designs already made; (name, fs, fL, fH, b) -> coefficients
+FIR_CACHE = {}
+# IIR filter designs already made; (name, fs, fL, fH, ftype, order, rp, rs) -> second-order sections
+IIR_CACHE = {}
+
 def nextpow2(i):
     n = 1
     while n < i: n *= 2
@@ -34,20 +40,37 @@ class FirFilter(object):
         if not N % 2: N += 1
         self.N = N
 
-        self.fir_coef = np.ones(N)
+        key = (name, fs, fL, fH, b)
+        if key not in FIR_CACHE:
+            FIR_CACHE[key] = self.fir_design(name, fs, fL, fH, N)
+        self.fir_coef = FIR_CACHE[key]
+
+    def fir_design(self, name, fs, fL, fH, N):
+        fir_coef = np.ones(N)
         if name == 'FIR_pass' and fL == 0:
-            self.fir_coef = self.fir_lowpass(float(fH/fs), N)
+            fir_coef = self.fir_lowpass(float(fH/fs), N)
         elif name == 'FIR_pass' and fH == 0:
-            self.fir_coef = self.fir_lowpass(float(fL/fs), N)
+            fir_coef = self.fir_lowpass(float(fL/fs), N)
+        elif name == 'FIR_pass':
+            fir_coef = self.fir_bandpass(float(fL/fs), float(fH/fs), N)
         elif name == 'FIR_block':
-            self.fir_coef = self.fir_bandblock(fL/fs, fH/fs, N)
+            fir_coef = self.fir_bandblock(fL/fs, fH/fs, N)
+        fir_coef.flags.writeable = False
+
+        return fir_coef
 
     def apply(self, x):
-        xlp = np.convolve(x, self.fir_coef)
+        # x : 1 x tnum or cnum x tnum; filtered along the last (time) axis
+        # overlap-add (FFT) convolution of all channels at once
+        h = self.fir_coef.reshape((1,)*(x.ndim - 1) + (-1,))
+        xlp = signal.oaconvolve(x, h, mode='full', axes=-1)
+
+        d = int(len(self.fir_coef)/2) # delay correction
+        tnum = x.shape[-1]
         if self.name == 'FIR_pass' and self.fH == 0: # high pass filter
-            x = x - xlp[int(self.N/2):int(self.N/2 + len(x))] # delay correction
+            x = x - xlp[...,d:(d + tnum)]
         else:
-            x = xlp[int(self.N/2):int(self.N/2 + len(x))] # delay correction
+            x = xlp[...,d:(d + tnum)]
 
         return x
 
@@ -65,6 +88,17 @@ class FirFilter(object):
 
         return h
 
+    def fir_bandpass(self, fL, fH, N):
+        # Compute a high-pass filter with cutoff frequency fL.
+        hhpf = -self.fir_lowpass(fL, N)
+        hhpf[int((N - 1) / 2)] += 1
+        # Compute a low-pass filter with cutoff frequency fH.
+        hlpf = self.fir_lowpass(fH, N)
+        # Cascade both filters into a single kernel (2N - 1 taps).
+        h = np.convolve(hhpf, hlpf)
+
+        return h
+
     def fir_bandblock(self, fL, fH, N):
         n = np.arange(N)
 
@@ -84,13 +118,172 @@ class FirFilter(object):
         return h
 
 
+class IirFilter(object):
+    def __init__(self, name, fs, fL, fH, ftype='butter', order=4, rp=0.1, rs=60):
+        # ftype = 'butter', 'cheby1', 'cheby2', 'ellip'
+        # rp [dB] : maximum ripple in the passband (cheby1, ellip)
+        # rs [dB] : minimum attenuation in the stopband (cheby2, ellip)
+        self.name = name
+        self.fs = fs
+        self.fL = fL
+        self.fH = fH
+        self.ftype = ftype
+        self.order = order
+
+        key = (name, fs, fL, fH, ftype, order, rp, rs)
+        if key not in IIR_CACHE:
+            IIR_CACHE[key] = self.iir_design(name, fs, fL, fH, ftype, order, rp, rs)
+        self.sos = IIR_CACHE[key]
+
+    def iir_design(self, name, fs, fL, fH, ftype, order, rp, rs):
+        if name == 'IIR_pass' and fL == 0:
+            btype, fc = 'lowpass', fH
+        elif name == 'IIR_pass' and fH == 0:
+            btype, fc = 'highpass', fL
+        elif name == 'IIR_pass':
+            btype, fc = 'bandpass', [fL, fH]
+        elif name == 'IIR_block':
+            btype, fc = 'bandstop', [fL, fH]
+
+        sos = signal.iirfilter(order, fc, rp=rp, rs=rs, btype=btype, ftype=ftype, output='sos', fs=fs)
+
+        return sos
+
+    def apply(self, x):
+        # x : 1 x tnum or cnum x tnum; filtered along the last (time) axis
+        # forward-backward filtering of all channels at once for zero phase
+        x = signal.sosfiltfilt(self.sos, x, axis=-1)
+
+        return x
+
+
+class DemodFilter(object):
+    def __init__(self, fs, fL, fH, q=0, b=0):
+        # complex demodulation of the [fL, fH] band
+        # q = 0 : decimation factor for 2x oversampled complex output
+        # b = 0 : transition band of the low pass filter set by the bandwidth
+        self.fs = fs
+        self.fL = fL
+        self.fH = fH
+        self.f0 = (fL + fH)/2.0 # center frequency shifted to zero
+
+        if q == 0:
+            q = max(1, int(fs/(2.0*(fH - fL))))
+        self.q = q
+
+        if b == 0:
+            b = float((fH - fL)/fs)
+        self.b = b
+
+        # low pass filter with the pass band edge at the half bandwidth and the transition band above it
+        # (the cutoff of the windowed sinc is the center of the transition band)
+        self.fc = (fH - fL)/2.0 + b*fs/2.0
+        self.lpf = FirFilter('FIR_pass', fs, 0, self.fc, b)
+
+    def apply(self, x, time):
+        # x : 1 x tnum or cnum x tnum; time : 1 x tnum
+        # OUT : decimated time, complex baseband signal
+
+        # heterodyne
+        y = x * np.exp(-2.0j*np.pi*self.f0*time)
+
+        # low pass filter and decimate; only the retained samples are filtered (polyphase)
+        y = signal.resample_poly(y, 1, self.q, axis=-1, window=self.lpf.fir_coef)
+
+        return time[::self.q], y
+
+
 class SvdFilter(object):
-    def __init__(self, cutoff=0.9):
+    def __init__(self, cutoff=0.9, method='cov', rank=20, tchunk=0, seed=0):
+        # method = 'svd' : full SVD of the (tnum x good channels) data matrix
+        # method = 'cov' : eigen decomposition of the (good channels x good channels) covariance matrix
+        # method = 'rand' : randomized truncated SVD of the given rank for very wide arrays
+        #                 only rank modes are computed; when they have less than the cutoff energy,
+        #                 the rank is doubled (with a message) until the cutoff is reached
+        # tchunk > 0 : data are accumulated and reconstructed over chunks of tchunk samples ('cov', 'rand')
+        # seed : seed of the random test matrix ('rand'); the same seed gives the same filtered data
         self.cutoff = cutoff
+        self.method = method
+        self.rank = rank
+        self.tchunk = tchunk
+        self.seed = seed
 
     def apply(self, data, good_channels, verbose=0):
         if np.sum(good_channels) == 0:
             good_channels = self.check_data(data)
+
+        if self.method == 'svd':
+            return self.apply_svd(data, good_channels, verbose=verbose)
+
+        cnum, tnum = data.shape
+        gidx = np.where(np.asarray(good_channels) == 1)[0]
+        tchunk = self.tchunk if self.tchunk > 0 else tnum
+        tidx = [(t1, min(t1 + tchunk, tnum)) for t1 in range(0, tnum, tchunk)]
+
+        # X = (data - xm)/sqrt(tnum) for the good channels; X X^T = covariance
+        xm = np.zeros(len(gidx))
+        for t1, t2 in tidx:
+            xm += np.sum(data[gidx,t1:t2], 1)
+        xm = xm/tnum
+
+        if self.method == 'cov':
+            C = np.zeros((len(gidx), len(gidx)))
+            for t1, t2 in tidx:
+                X = data[gidx,t1:t2] - xm[:,np.newaxis]
+                C += np.dot(X, X.T)/tnum
+
+            # eigen values are the squared singular values
+            sv, V = np.linalg.eigh(C)
+            sv = np.clip(sv[::-1], 0, None)
+            V = V[:,::-1]
+            E = np.sum(sv)
+        elif self.method == 'rand':
+            # rank is doubled until the computed modes reach the cutoff energy
+            rank = min(self.rank, len(gidx))
+            while True:
+                sv, V, E = self.rand_modes(data, gidx, xm, tidx, tnum, rank)
+                if np.sum(sv)/E >= self.cutoff or rank == len(gidx):
+                    break
+                print('#### rank {:d} modes have {:g} of the energy < cutoff {:g}; rank {:d} ####'.format(rank, np.sum(sv)/E, self.cutoff, min(2*rank, len(gidx))))
+                rank = min(2*rank, len(gidx))
+
+        # energy of mode and the entropy
+        self.report(sv, E, len(gidx), verbose=verbose)
+
+        # filtering
+        V = V[:,np.cumsum(sv)/E < self.cutoff]
+
+        # reconstruct by projection on the remaining modes
+        for t1, t2 in tidx:
+            X = data[gidx,t1:t2] - xm[:,np.newaxis]
+            data[gidx,t1:t2] = np.dot(V, np.dot(V.T, X)) + xm[:,np.newaxis]
+
+        return data
+
+    def rand_modes(self, data, gidx, xm, tidx, tnum, rank):
+        # randomized range finder with power iterations [Halko SIAM Rev. 2011]
+        # OUT : rank squared singular values, good channels x rank modes, total energy
+        nq = min(rank + 10, len(gidx)) # oversampling
+        rng = np.random.default_rng(self.seed)
+        Q = rng.standard_normal((len(gidx), nq))
+        E = 0
+        for i in range(3):
+            Q, _ = np.linalg.qr(Q)
+            Y = np.zeros(Q.shape) # Y = X X^T Q
+            for t1, t2 in tidx:
+                X = data[gidx,t1:t2] - xm[:,np.newaxis]
+                Y += np.dot(X, np.dot(X.T, Q))/tnum
+                if i == 0: E += np.sum(X**2)/tnum
+            if i < 2: Q = Y
+
+        # eigen decomposition in the subspace of Q
+        sv, W = np.linalg.eigh(np.dot(Q.T, Y))
+        sv = np.clip(sv[::-1][0:rank], 0, None)
+        V = np.dot(Q, W[:,::-1][:,0:rank])
+
+        return sv, V, E
+
+    def apply_svd(self, data, good_channels, verbose=0):
         cnum, tnum = data.shape
         
         X = np.zeros((tnum, int(np.sum(good_channels))))
@@ -110,20 +303,7 @@ class SvdFilter(object):
         # energy of mode and the entropy
         sv = s**2
         E = np.sum(sv)
-        pi = sv / E
-        nsent = st.ns_entropy(pi)
-        print('The normalized Shannon entropy of sv is {:g}'.format(nsent))
-
-        if verbose == 1:
-            ax1 = plt.subplot(211)
-            ax1.plot(pi)
-            ax2 = plt.subplot(212)
-            ax2.plot(np.cumsum(sv)/np.sum(sv))
-            ax2.axhline(y=self.cutoff, color='r')
-            ax1.set_ylabel('SV power')
-            ax2.set_ylabel('Cumulated sum')
-            ax2.set_xlabel('Mode number')
-            plt.show()
+        self.report(sv, E, len(sv), verbose=verbose)
 
         # filtering
         s[np.cumsum(sv)/np.sum(sv) >= self.cutoff] = 0
@@ -141,6 +321,25 @@ class SvdFilter(object):
 
         return data
 
+    def report(self, sv, E, mnum, verbose=0):
+        # sv : energy of modes, E : total energy, mnum : total number of modes
+        pi = sv / E
+        if len(pi) < mnum: # truncated SVD; the remaining energy is evenly distributed
+            pi = np.hstack([pi, np.ones(mnum - len(pi))*(1 - np.sum(pi))/(mnum - len(pi))])
+        nsent = st.ns_entropy(pi)
+        print('The normalized Shannon entropy of sv is {:g}'.format(nsent))
+
+        if verbose == 1:
+            ax1 = plt.subplot(211)
+            ax1.plot(pi)
+            ax2 = plt.subplot(212)
+            ax2.plot(np.cumsum(sv)/E)
+            ax2.axhline(y=self.cutoff, color='r')
+            ax1.set_ylabel('SV power')
+            ax2.set_ylabel('Cumulated sum')
+            ax2.set_xlabel('Mode number')
+            plt.show()
+
     def check_data(self, data):
         cnum, tnum = data.shape
         good_channels = np.ones(cnum)
@@ -159,51 +358,80 @@ class Wave2dFilter(object):
         self.lim = lim
 
     def apply(self, data, verbose=0):
+        # data : row x column image, or frames x row x column stack of images
         wavename = self.wavename
-        alpha = self.alpha
-        lim = self.lim
 
-        dim = min(data.shape)
+        single = (data.ndim == 2)
+        if single: data = data[np.newaxis,:,:]
+        fnum = data.shape[0]
+
+        dim = min(data.shape[1:])
 
         if np.abs(dim - nextpow2(dim)) < np.abs(dim - (nextpow2(dim)/2)):
             level = int(np.log2(nextpow2(dim)))
         else:
             level = int(np.log2(nextpow2(dim)/2))
 
-        # wavelet transform
-        coeffs = pywt.wavedec2(data, wavename, level=level)
+        # wavelet transform of all frames along the spatial axes
+        coeffs = pywt.wavedec2(data, wavename, level=level, axes=(-2,-1))
+
+        # coefficients of each frame in a row
+        clist = [coeffs[0]] + [c for i in range(1,len(coeffs)) for c in coeffs[i]]
+        coef1d = np.hstack([c.reshape((fnum, -1)) for c in clist])  # frames x ~ size x size
+
+        # noise level of each frame
+        e, clev, ilev = self.noise_level(coef1d)
+
+        # obtain the coherent part
+        for c in clist:
+            c[np.abs(c) < e[:,np.newaxis,np.newaxis]] = 0
+        coh_data = pywt.waverec2(coeffs, wavename, axes=(-2,-1))
+
+        if single:
+            return coh_data[0], clev[0], ilev[0]
+        else:
+            return coh_data, clev, ilev
+
+    def noise_level(self, coef1d):
+        # iterative thresholding of all frames (rows of coef1d) at once
+        alpha = self.alpha
+        lim = self.lim
 
         # set an intial threshold (noise level)
-        coef1d = coeffs[0].reshape((coeffs[0].size,))
-        for i in range(1,len(coeffs)):
-            for j in range(len(coeffs[i])):
-                coef1d = np.hstack((coef1d, coeffs[i][j].reshape((coeffs[i][j].size,))))  # ~ size x size
-        tlev = np.sum(coef1d**2) 
-        e = alpha*np.sqrt(np.var(coef1d)*np.log(coef1d.size))
-
-        # find the noise level via iteration
+        tlev = np.sum(coef1d**2, 1)
+        e = alpha*np.sqrt(np.var(coef1d, 1)*np.log(coef1d.shape[1]))
+
+        # find the noise level via iteration; idx = coefficients remaining in each frame
+        idx = np.ones(coef1d.shape, dtype=bool)
         old_e = 0.1*e
         new_e = e
-        while np.abs(new_e - old_e)/old_e*100 > lim:
-            old_e = new_e
-            idx = np.abs(coef1d) < old_e
-            coef1d = coef1d[idx]
-            new_e = alpha*np.sqrt(np.var(coef1d)*np.log(coef1d.size))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # frames still in iteration
+            fidx = np.where(np.abs(new_e - old_e)/old_e*100 > lim)[0]
+            fcoef = np.abs(coef1d[fidx])
+            fkeep = idx[fidx]
+            fnew_e = new_e[fidx]
+            while len(fidx) > 0:
+                fold_e = fnew_e
+                fkeep = fkeep * (fcoef < fold_e[:,np.newaxis])
+
+                n = np.sum(fkeep, 1)
+                m = np.sum(coef1d[fidx] * fkeep, 1) / n
+                v = np.sum(((coef1d[fidx] - m[:,np.newaxis]) * fkeep)**2, 1) / n
+                fnew_e = alpha*np.sqrt(v*np.log(n))
+
+                # save and drop the converged frames
+                cont = np.abs(fnew_e - fold_e)/fold_e*100 > lim
+                old_e[fidx] = fold_e
+                if not np.all(cont):
+                    idx[fidx[~cont]] = fkeep[~cont]
+                    fidx, fcoef, fkeep, fnew_e = fidx[cont], fcoef[cont], fkeep[cont], fnew_e[cont]
         e = old_e
 
         # get norms of the coherent and incoherent part 
-        ilev = np.sum(coef1d**2)
+        ilev = np.sum((coef1d * idx)**2, 1)
         clev = tlev - ilev
         clev = np.sqrt(clev) 
         ilev = np.sqrt(ilev) 
 
-        # obtain the coherent part    
-        idx = np.abs(coeffs[0]) < e
-        coeffs[0][idx] = 0
-        for i in range(1,len(coeffs)):
-            for j in range(len(coeffs[i])):
-                idx = np.abs(coeffs[i][j]) < e
-                coeffs[i][j][idx] = 0
-        coh_data = pywt.waverec2(coeffs, wavename) 
-
-        return coh_data, clev, ilev
\ No newline at end of file
+        return e, clev, ilev
@@ -8,8 +8,14 @@
 from scipy import signal
 import math
 import itertools
+import contextlib
+import os
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
 
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 
 import pickle
@@ -79,6 +85,8 @@ class FluctData(object):
         self.data = data
         self.time = time
 
+        touch_data(self)
+
         return time, data
 
     def time_base(self, trange):
@@ -98,6 +106,7 @@ class FluctAna(object):
     def add_data(self, D, trange, norm=1, atrange=[1.0, 1.01], res=0, verbose=1):
 
         D.get_data(trange, norm=norm, atrange=atrange, res=res, verbose=verbose)
+        touch_data(D)
         self.Dlist.append(D)
 
     def del_data(self, dnum):
@@ -128,6 +137,8 @@ class FluctAna(object):
         # update clist
         self.Dlist[dnum].clist = old_clist + clist
 
+        touch_data(self.Dlist[dnum])
+
         self.list_data()
 
     def del_channel(self, dnum, clist):
@@ -147,36 +158,40 @@ class FluctAna(object):
             # update clist
             self.Dlist[dnum].clist = [self.Dlist[dnum].clist[k] for k in range(len(self.Dlist[dnum].clist)) if k not in del_idx]
 
+        touch_data(self.Dlist[dnum])
+
         self.list_data()
 
 ############################# down sampling #############################
 
-    def downsample(self, dnum, q, verbose=0):
+    def downsample(self, dnum, q, up=1, ftype='iir', verbose=0):
         # down sampling after anti-aliasing filter
+        # ftype = 'iir' or 'fir' : decimation by an integer factor q
+        # ftype = 'poly' (or up > 1) : polyphase resampling by a rational factor up/q
         D = self.Dlist[dnum]
 
-        cnum = len(D.data)
+        raw_time = D.time
+        raw_data = D.data
 
-        # plot dimension
-        if cnum < 4:
-            row = cnum
+        # down sample all channels at once along the time axis
+        if ftype == 'poly' or up > 1:
+            D.data = signal.resample_poly(raw_data, up, q, axis=1)
+            D.time = raw_time[0] + np.arange(D.data.shape[1])*(raw_time[1] - raw_time[0])*q/up
         else:
-            row = 4
-        col = math.ceil(cnum/row)
+            D.data = signal.decimate(raw_data, q, ftype=ftype, axis=1)
+            D.time = raw_time[::q]
 
-        # new time axis
-        raw_time = np.copy(D.time)
-        tnum = len(D.time)
-        idx = np.arange(0, tnum, q)
-        D.time = D.time[idx]
+        if verbose == 1:
+            cnum = len(D.data)
 
-        # down sample
-        raw_data = np.copy(D.data)
-        D.data = np.empty((cnum, len(D.time)))
-        for c in range(cnum):
-            D.data[c,:] = signal.decimate(raw_data[c,:], q)
+            # plot dimension
+            if cnum < 4:
+                row = cnum
+            else:
+                row = 4
+            col = math.ceil(cnum/row)
 
-            if verbose == 1:
+            for c in range(cnum):
                 # plot info
                 pshot = D.shot
                 pname = D.clist[c]
@@ -194,39 +209,80 @@ class FluctAna(object):
 
                 plt.title('#{:d}, {:s}'.format(pshot, pname), fontsize=10)
 
-        if verbose == 1: plt.show()
+            plt.show()
 
         D.fs = round(1/(D.time[1] - D.time[0]))
-        print('down sample with q={:d}, fs={:g}'.format(q, D.fs))
+        touch_data(D)
+        print('down sample with q={:d}, up={:d}, fs={:g}'.format(q, up, D.fs))
 
 ############################# data filtering functions #########################
 
-    def filt(self, dnum=0, name='FIR_pass', fL=0, fH=10000, b=0.08, verbose=0):
+    def filt(self, dnum=0, name='FIR_pass', fL=0, fH=10000, b=0.08, verbose=0, ftype='butter', order=4, rp=0.1, rs=60):
+        # name = 'FIR_pass', 'FIR_block' : windowed-sinc FIR filter; smaller b is sharper
+        # name = 'IIR_pass', 'IIR_block' : zero phase IIR filter of ftype and order
+        # rp [dB] : maximum passband ripple (cheby1, ellip); rs [dB] : minimum stopband attenuation (cheby2, ellip)
         D = self.Dlist[dnum]
 
         # select filter except svd
         if name[0:3] == 'FIR':
             freq_filter = ft.FirFilter(name, D.fs, fL, fH, b)
+        elif name[0:3] == 'IIR':
+            freq_filter = ft.IirFilter(name, D.fs, fL, fH, ftype=ftype, order=order, rp=rp, rs=rs)
+
+        # filter all channels at once along the time axis
+        D.data[:,:] = freq_filter.apply(D.data)
+        touch_data(D)
+
+        if name[0:3] == 'IIR':
+            if ftype in ['cheby1', 'cheby2', 'ellip']:
+                print('dnum {:d} filter {:s} with fL {:g} fH {:g} {:s} order {:d} rp {:g} rs {:g}'.format(dnum, name, fL, fH, ftype, order, rp, rs))
+            else:
+                print('dnum {:d} filter {:s} with fL {:g} fH {:g} {:s} order {:d}'.format(dnum, name, fL, fH, ftype, order))
+        else:
+            print('dnum {:d} filter {:s} with fL {:g} fH {:g} b {:g}'.format(dnum, name, fL, fH, b))
+
+    def demod(self, dnum=0, fL=10000, fH=20000, q=0, b=0):
+        # complex demodulation; the [fL, fH] band is shifted to baseband, low pass filtered and decimated by q
+        # spectral methods then work on the complex signal with fftbins(full=1)
+        # and their frequency axes are shifted back by D.fshift
+        # fftbins does not detrend the demodulated data (detrend=-1), as their zero frequency is the band center
+        # demodulated data can be demodulated again with [fL, fH] in the original frequencies; the shifts add up
+        D = self.Dlist[dnum]
 
-        for c in range(len(D.clist)):
-            x = np.copy(D.data[c,:])
-            D.data[c,:] = freq_filter.apply(x)
+        fshift = D.fshift if hasattr(D, 'fshift') else 0
+        if np.iscomplexobj(D.data):
+            flim = [fshift - D.fs/2.0, fshift + D.fs/2.0]
+        else:
+            flim = [0, D.fs/2.0]
+        if fL < flim[0] or fH > flim[1] or fL >= fH:
+            print('#### [fL, fH] = [{:g}, {:g}] is not in the frequency range [{:g}, {:g}] ####'.format(fL, fH, flim[0], flim[1]))
+            return
+
+        demod_filter = ft.DemodFilter(D.fs, fL - fshift, fH - fshift, q=q, b=b)
 
-        print('dnum {:d} filter {:s} with fL {:g} fH {:g} b {:g}'.format(dnum, name, fL, fH, b))
+        D.time, D.data = demod_filter.apply(D.data, D.time)
+        D.fs = D.fs/demod_filter.q
+        D.fshift = fshift + demod_filter.f0
+        touch_data(D)
 
-    def svd_filt(self, dnum=0, cutoff=0.9, verbose=0):
+        print('dnum {:d} demodulation with fL {:g} fH {:g} q {:d}, fs={:g}'.format(dnum, fL, fH, demod_filter.q, D.fs))
+
+    def svd_filt(self, dnum=0, cutoff=0.9, verbose=0, method='cov', rank=20, tchunk=0, seed=0):
+        # method = 'svd' (full SVD), 'cov' (channel covariance), 'rand' (randomized truncated SVD of rank with the random seed)
         D = self.Dlist[dnum]
 
-        svd_filter = ft.SvdFilter(cutoff = cutoff)
+        svd_filter = ft.SvdFilter(cutoff=cutoff, method=method, rank=rank, tchunk=tchunk, seed=seed)
 
         if hasattr(D, 'good_channels'):
             D.data = svd_filter.apply(D.data, D.good_channels, verbose=verbose)
         else:
             D.data = svd_filter.apply(D.data, np.zeros(len(D.clist)), verbose=verbose)
+        touch_data(D)
 
-        print('dnum {:d} svd filter with cutoff {:g}'.format(dnum, cutoff))
+        print('dnum {:d} svd filter ({:s}) with cutoff {:g}'.format(dnum, method, cutoff))
 
-    def wave2d_filt(self, dnum=0, row=24, column=8, wavename='coif3', alpha=1.0, lim=5, bcut=0.0, verbose=0):
+    def wave2d_filt(self, dnum=0, row=24, column=8, wavename='coif3', alpha=1.0, lim=5, bcut=0.0, verbose=0, fchunk=500, nproc=1):
+        # frames are filtered in chunks of fchunk frames, over nproc processes if nproc > 1
         D = self.Dlist[dnum]
 
         wave2d_filter = ft.Wave2dFilter(wavename=wavename, alpha=alpha, lim=lim)
@@ -238,41 +294,69 @@ class FluctAna(object):
         self.clev = np.zeros(tnum)
         self.ilev = np.zeros(tnum)
 
-        for i in range(tnum):
-            data1d = D.data[:,i]
-
-            # fill bad channel
-            if bcut > 0:
-                data1d = ms.fill_bad_channel(data1d, rpos, zpos, D.good_channels, bcut) 
-
-            # make it 2D
-            data2d = data1d.reshape((row,column))
+        # fill bad channel of all frames
+        if bcut > 0:
+            D.data = ms.fill_bad_channel(D.data, rpos, zpos, D.good_channels, bcut)
+
+        # chunks of frames; a stack of 2D frames is made only when the chunk is filtered
+        tidx = [(t1, min(t1 + fchunk, tnum)) for t1 in range(0, tnum, fchunk)]
+        chunks = lambda tlist: (D.data[:,t1:t2].T.reshape((t2 - t1, row, column)) for t1, t2 in tlist)
+
+        # apply filter
+        if nproc > 1:
+            # nproc chunks at a time
+            with ProcessPoolExecutor(max_workers=nproc) as pool:
+                for g in range(0, len(tidx), nproc):
+                    tlist = tidx[g:(g + nproc)]
+                    self.wave2d_put(D, tlist, pool.map(wave2d_filter.apply, chunks(tlist)), verbose)
+        else:
+            self.wave2d_put(D, tidx, map(wave2d_filter.apply, chunks(tidx)), verbose)
 
-            # apply filter
-            data2d, self.clev[i], self.ilev[i] = wave2d_filter.apply(data2d)
+        touch_data(D)
 
-            # make it 1D
-            D.data[:,i] = data2d.reshape(data1d.shape)
-
-            if verbose == 1 and i%100 ==0: print('wave2d filter: {:d}/{:d} done'.format(i, tnum))
-        
         if verbose == 1:
             plt.plot(D.time, self.clev, 'r')
             plt.plot(D.time, self.ilev, 'b')
             plt.show()
 
+    def wave2d_put(self, D, tlist, results, verbose=0):
+        # put the filtered chunks of frames back in D.data
+        tnum = len(D.time)
+        for (t1, t2), (data3d, clev, ilev) in zip(tlist, results):
+            # make it 1D
+            D.data[:,t1:t2] = data3d.reshape((t2 - t1, -1)).T
+            self.clev[t1:t2] = clev
+            self.ilev[t1:t2] = ilev
+
+            if verbose == 1: print('wave2d filter: {:d}/{:d} done'.format(t2, tnum))
+
 
 ############################# spectral methods #############################
 
-    def fftbins(self, nfft, window, overlap, detrend, full=0):
+    def fftbins(self, nfft, window, overlap, detrend, full=0, dtype=np.complex_, half=0):
         # IN : self, data set number, nfft, window name, detrend or not
         # OUT : bins x N FFT of time series data; frequency axis
+        # dtype = np.complex64 halves the memory of spdata
+        # half = 1 with full = 1 stores only 0 ~ fN of real data; get_spdata() rebuilds -fN ~ fN
+        # demodulated data (D.fshift) are not detrended (detrend=-1)
         # self.list_data()
 
         for d, D in enumerate(self.Dlist):
+            # skip the data set unchanged since the last transform with the same parameters
+            spkey = ('fftbins', data_version(D), nfft, window, overlap, detrend, full, np.dtype(dtype).str, half)
+            if hasattr(D, 'spkey') and D.spkey == spkey:
+                print('dnum {:d} fftbins is up to date'.format(d))
+                continue
+
+            if hasattr(D, 'stream_chunk') and D.stream_chunk == (data_version(D), D.time[0], len(D.time)):
+                print('#### dnum {:d} holds only the last chunk [{:g}, {:g}] s of stream_spec ####'.format(d, D.time[0], D.time[-1]))
+
             # get bins and window function
             tnum = len(D.time)
             bins, win = sp.fft_window(tnum, nfft, window, overlap)
+            if bins < 1:
+                print('#### dnum {:d} with {:d} samples is shorter than nfft {:d}; no fftbins ####'.format(d, tnum, nfft))
+                continue
             dt = D.time[1] - D.time[0]  # time step
 
             D.window = window
@@ -281,31 +365,64 @@ class FluctAna(object):
             D.bins = bins
             D.tavg = 0
             D.bidx = np.arange(bins)
+            D.btime = D.time[np.arange(bins)*int(np.fix(nfft*(1 - overlap))) + int(nfft/2)]  # center time of bins
+
+            # half storage of the full range only for real data
+            if full == 1 and half == 1 and not np.iscomplexobj(D.data):
+                D.half = 1
+                sfull = 0
+            else:
+                D.half = 0
+                sfull = full
 
             # make fft data
             cnum = len(D.data)
-            if full == 1: # full shift to -fN ~ 0 ~ fN
+            if sfull == 1: # full shift to -fN ~ 0 ~ fN
                 if np.mod(nfft, 2) == 0:  # even nfft
-                    D.spdata = np.zeros((cnum, bins, nfft+1), dtype=np.complex_)
+                    D.spdata = np.zeros((cnum, bins, nfft+1), dtype=dtype)
                 else:  # odd nfft
-                    D.spdata = np.zeros((cnum, bins, nfft), dtype=np.complex_)
+                    D.spdata = np.zeros((cnum, bins, nfft), dtype=dtype)
             else: # half 0 ~ fN
-                D.spdata = np.zeros((cnum, bins, int(nfft/2+1)), dtype=np.complex_)
+                D.spdata = np.zeros((cnum, bins, int(nfft/2+1)), dtype=dtype)
 
-            for c in range(cnum):
-                x = D.data[c,:]
-                D.ax, D.spdata[c,:,:], D.win_factor = sp.fftbins(x, dt, nfft, window, overlap, detrend, full)
+            # the zero frequency of the demodulated data is the center of the band; no detrending
+            if hasattr(D, 'fshift'):
+                sdetrend = -1
+            else:
+                sdetrend = detrend
+
+            # blocks of channels; about sp.CHUNK_POINTS samples of segments at once
+            cstep = sp.chunk_size(bins*nfft)
+            for c in range(0, cnum, cstep):
+                x = D.data[c:(c + cstep),:]
+                D.ax, D.spdata[c:(c + cstep),:,:], D.win_factor = sp.fftbins(x, dt, nfft, window, overlap, sdetrend, sfull)
+
+            # frequency axis of the full range for half storage
+            if D.half == 1:
+                D.ax = np.concatenate([-D.ax[:0:-1], D.ax])
+
+            # frequency axis of the demodulated data
+            if hasattr(D, 'fshift'):
+                D.ax = D.ax + D.fshift
 
             # update attributes
             if np.mod(nfft, 2) == 0:
                 D.nfft = nfft + 1
             else:
                 D.nfft = nfft
+            D.full = full
+            D.spkey = spkey
 
-            print('dnum {:d} fftbins {:d} with {:s} size {:d} overlap {:g} detrend {:d} full {:d}'.format(d, bins, window, nfft, overlap, detrend, full))
+            print('dnum {:d} fftbins {:d} with {:s} size {:d} overlap {:g} detrend {:d} full {:d} {:s} half {:d}'.format(d, bins, window, nfft, overlap, detrend, full, np.dtype(dtype).name, D.half))
 
     def cwt(self, df, full=0, tavg=0): ## problem in recovering the signal
         for d, D in enumerate(self.Dlist):
+            # skip the data set unchanged since the last transform with the same parameters
+            spkey = ('cwt', data_version(D), df, full, tavg)
+            if hasattr(D, 'spkey') and D.spkey == spkey:
+                print('dnum {:d} cwt is up to date'.format(d))
+                continue
+
             # make a t-axis
             dt = D.time[1] - D.time[0]  # time step
             tnum = len(D.time)
@@ -333,29 +450,28 @@ class FluctAna(object):
             snum = len(sj)
             # value dimension
             D.spdata = np.zeros((cnum, tnum, (1+full)*snum-(1*full)), dtype=np.complex_)
-            for c in range(cnum):
-                x = D.data[c,:]
-
-                # FFT of signal
-                X = np.fft.fft(x, n=nfft)/nfft
-
-                # calculate CWT
-                cwtdata = np.zeros((nfft, snum), dtype=np.complex_)
-                for j, s in enumerate(sj):
-                    # nondimensional time axis at time scale s
-                    eta = t/s
-                    # FFT of the normalized wavelet function
-                    W = np.fft.fft( np.conj( wf0(eta - np.mean(eta))*np.sqrt(dt/s) ) )
-                    # Wavelet transform at scae s for all n time
-                    # cwtdata[:,j] = np.fft.fftshift(np.fft.ifft(X * W) * nfft)
-                    cwtdata[:,j] = np.conj(np.fft.fftshift(np.fft.ifft(X * W) * nfft)) # phase direction correct
 
-                # full size
-                if full == 1:
-                    cwtdata = np.hstack([np.fliplr(np.conj(cwtdata)), cwtdata[:,1:]])
+            # FFT of signals
+            X = sp.fft(D.data, n=nfft, axis=-1)/nfft
+
+            # blocks of scales; about sp.CHUNK_POINTS points in a batched transform
+            sstep = sp.chunk_size(cnum*nfft)
+            for j1 in range(0, snum, sstep):
+                j2 = min(j1 + sstep, snum)
+                s = sj[j1:j2,np.newaxis]
+                # nondimensional time axis at time scales s
+                eta = t/s
+                # FFT of the normalized wavelet functions
+                W = sp.fft( np.conj( wf0(eta - np.mean(eta, axis=1, keepdims=True))*np.sqrt(dt/s) ), axis=-1 )
+                # Wavelet transform at scales s for all n time
+                cwtdata = np.conj(np.fft.fftshift(sp.ifft(X[:,np.newaxis,:] * W, axis=-1) * nfft, axes=-1)) # phase direction correct
 
                 # return until tnum
-                D.spdata[c,:,:] = cwtdata[0:tnum,:]
+                cwtdata = np.transpose(cwtdata[:,:,0:tnum], (0,2,1))
+                D.spdata[:,:,(snum-1)*full+j1:(snum-1)*full+j2] = cwtdata
+                # full size
+                if full == 1:
+                    D.spdata[:,:,(snum-j2):(snum-j1)] = np.conj(cwtdata[:,:,::-1])
 
             if full == 1:
                 ax = np.hstack([-ax[::-1], ax[1:]])
@@ -366,9 +482,190 @@ class FluctAna(object):
             D.tavg = tavg
             D.bidx = np.where((np.mean(D.time) - tavg*1e-6/2 < D.time)*(D.time < np.mean(D.time) + tavg*1e-6/2))[0]
             D.bins = len(D.bidx)
+            D.btime = D.time
+            D.full = full
+            D.half = 0
+            D.spkey = spkey
 
             print('dnum {:d} cwt with Morlet omega0 = 6.0, df {:g}'.format(d, df))
 
+    def cross_spec(self, done=0, dtwo=1):
+        # IN : data number one (ref), data number two (cmp)
+        # OUT : cnum x faxis bin averages of Pxy, Pxx, Pyy and normalized Gxy
+        # cached on data two until either spectrum or the bins (bidx) change
+        # no cache for spectra without spkey (made by correlation, corr_coef, fftbins_bicoh_test)
+        D1 = self.Dlist[done]
+        D2 = self.Dlist[dtwo]
+
+        key = (id(D1), getattr(D1, 'spkey', None), getattr(D2, 'spkey', None), D2.bidx.tobytes())
+        cache = key[1] is not None and key[2] is not None
+        if cache and hasattr(D2, 'xcache') and D2.xcache['key'] == key:
+            return D2.xcache['Pxy'], D2.xcache['Pxx'], D2.xcache['Pyy'], D2.xcache['Gxy']
+
+        rnum = len(D1.data)  # number of ref channels
+        cnum = len(D2.data)  # number of cmp channels
+        nfreq = len(D2.ax)
+
+        # value dimension
+        Pxy = np.zeros((cnum, nfreq), dtype=np.complex_)
+        Pxx = np.zeros((cnum, nfreq))
+        Pyy = np.zeros((cnum, nfreq))
+        Gxy = np.zeros((cnum, nfreq), dtype=np.complex_)
+
+        # half storage of both; average over 0 ~ fN and rebuild -fN ~ fN
+        half = hasattr(D1, 'half') and D1.half == 1 and hasattr(D2, 'half') and D2.half == 1
+
+        # blocks of channels; about sp.CHUNK_POINTS points in a temporary
+        cstep = sp.chunk_size(len(D2.bidx)*nfreq)
+        for c1 in range(0, cnum, cstep):
+            c2 = min(c1 + cstep, cnum)
+            if rnum == 1:
+                cref = slice(0, 1)
+            else:
+                cref = slice(c1, c2)
+
+            if half:
+                XX = D1.spdata[cref,:,:]
+                YY = D2.spdata[c1:c2,:,:]
+            else:
+                XX = get_spdata(D1, cref)
+                YY = get_spdata(D2, slice(c1, c2))
+
+            vals = sp.cross_spec(XX, YY, D2.bidx)
+            if half:
+                vals = [sp.full_layout(v) for v in vals]
+
+            Pxy[c1:c2,:], Pxx[c1:c2,:], Pyy[c1:c2,:], Gxy[c1:c2,:] = vals
+
+        if cache:
+            D2.xcache = {'key':key, 'ref':D1, 'Pxy':Pxy, 'Pxx':Pxx, 'Pyy':Pyy, 'Gxy':Gxy}
+        elif hasattr(D2, 'xcache'):
+            del D2.xcache
+
+        return Pxy, Pxx, Pyy, Gxy
+
+    def stream_spec(self, done=0, dtwo=1, trange=[0, 1], tchunk=0.1, nfft=512, window='hann', overlap=0.5, detrend=0, full=0, norm=1, atrange=[1.0, 1.01], res=0):
+        # IN : data number one (ref), data number two (cmp), time range [s] read in chunks of tchunk [s]
+        # OUT : running sums of cross spectra for cross_power, coherence, cross_phase and correlation
+        # data sets are read again with get_data for each chunk; segment spectra are not kept
+        # in memory records (FluctData) are not read again but sliced as they are (norm, atrange, res are not used)
+        # norm = 1 normalizes each chunk read again by its own average, which differs from the normalization by
+        # the whole record average; norm = 2 (atrange) is common to all chunks
+        # chunks advance by sample index; the next chunk starts at the next segment
+        # after the stream, data sets read again hold only the last chunk (time, data) and no spdata;
+        # fftbins warns about it; add_data again for spectra of the whole record
+        D1 = self.Dlist[done]
+        D2 = self.Dlist[dtwo]
+        if D1 is D2:
+            DD = [D1]
+        else:
+            DD = [D1, D2]
+
+        # in memory records
+        rec = []
+        for D in DD:
+            if type(D).get_data is FluctData.get_data:
+                rec.append((D.time, D.data))
+            else:
+                rec.append(None)
+
+        dt = D2.time[1] - D2.time[0]  # time step
+        plan = sp.fft_plan(nfft, window, overlap)
+        nchunk = max(1, int(round(tchunk/dt)))  # samples of a chunk
+
+        acc = None
+        t0 = trange[0]
+        n1 = 0 # samples from t0
+        while t0 + n1*dt < trange[1]:
+            t1 = t0 + n1*dt
+            t2 = min(t1 + nchunk*dt, trange[1])
+
+            # read a chunk; from the sample nearest to t1
+            for D, r in zip(DD, rec):
+                if r is None:
+                    D.get_data([t1 - dt/2.0, t2], norm=norm, atrange=atrange, res=res, verbose=0)
+                    if hasattr(D, 'fshift'): del D.fshift  # raw data again
+                else:
+                    i1 = np.searchsorted(r[0], t1 - dt/2.0)
+                    i2 = np.searchsorted(r[0], t2 + dt/2.0)
+                    D.time, D.data = r[0][i1:i2], r[1][:,i1:i2]
+                touch_data(D)
+            if n1 == 0 and len(D1.time) > 0: t0 = D1.time[0] # sample grid
+
+            tnum = min(len(D1.time), len(D2.time))
+            bins, _ = sp.fft_window(tnum, nfft, window, overlap)
+            if bins < 1:  # the rest is shorter than a segment
+                if acc is None: print('#### chunk [{:g}, {:g}] is shorter than nfft ####'.format(t1, t2))
+                break
+
+            # real data; sums over 0 ~ fN and rebuild -fN ~ fN
+            if np.iscomplexobj(D1.data) or np.iscomplexobj(D2.data):
+                sfull = full
+            else:
+                sfull = 0
+
+            ax, XX, win_factor = sp.fftbins(D1.data[:,0:tnum], dt, nfft, window, overlap, detrend, sfull)
+            if D1 is D2:
+                YY = XX
+            else:
+                _, YY, _ = sp.fftbins(D2.data[:,0:tnum], dt, nfft, window, overlap, detrend, sfull)
+
+            if acc is None:
+                acc = sp.CrossSpec(len(D2.data), XX.shape[-1])
+            acc.add(XX, YY)
+
+            print('stream [{:g}, {:g}] s with {:d} bins; {:d} bins in total'.format(t1, t2, bins, acc.n))
+
+            # the next chunk starts at the next segment
+            n1 = n1 + bins*plan.step
+
+        # in memory records back; data sets read again keep the last chunk only
+        for D, r in zip(DD, rec):
+            if r is not None:
+                D.time, D.data = r
+                touch_data(D)
+            else:
+                D.stream_chunk = (data_version(D), D.time[0], len(D.time))
+                print('#### data set holds only the last chunk [{:g}, {:g}] s of the stream ####'.format(D.time[0], D.time[-1]))
+
+        if acc is None:
+            return
+
+        # layout of the sums
+        acc.ax = ax
+        acc.win_factor = win_factor
+        acc.full = sfull
+
+        vals = acc.mean()
+        if full == 1 and sfull == 0:
+            ax = np.concatenate([-ax[:0:-1], ax])
+            vals = [sp.full_layout(v) for v in vals]
+
+        # update attributes as fftbins
+        for D in [D1, D2]:
+            if hasattr(D, 'spdata'): del D.spdata
+            D.window = window
+            D.overlap = overlap
+            D.detrend = detrend
+            D.bins = acc.n
+            D.tavg = 0
+            D.bidx = np.arange(acc.n)
+            D.ax = ax
+            D.win_factor = win_factor
+            if np.mod(nfft, 2) == 0:
+                D.nfft = nfft + 1
+            else:
+                D.nfft = nfft
+            D.full = full
+            D.half = 0
+            D.spkey = ('stream', data_version(D), tuple(trange), tchunk, nfft, window, overlap, detrend, full)
+
+        # cached sums for cross_spec
+        D2.cspec = acc
+        Pxy, Pxx, Pyy, Gxy = vals
+        key = (id(D1), D1.spkey, D2.spkey, D2.bidx.tobytes())
+        D2.xcache = {'key':key, 'ref':D1, 'Pxy':Pxy, 'Pxx':Pxx, 'Pyy':Pyy, 'Gxy':Gxy}
+
     def cross_power(self, done=0, dtwo=1):
         # IN : data number one (ref), data number two (cmp), etc
         # OUT : x-axis (ax), y-axis (val)
@@ -381,25 +678,22 @@ class FluctAna(object):
         # reference channel names
         self.Dlist[dtwo].rname = []
 
+        # bin averaged cross spectra
+        Pxy, _, _, _ = self.cross_spec(done, dtwo)
+
         # value dimension
-        self.Dlist[dtwo].val = np.zeros((cnum, len(self.Dlist[dtwo].ax)))
+        self.Dlist[dtwo].val = np.abs(Pxy / self.Dlist[dtwo].win_factor).real
 
         # calculation loop for multi channels
         for c in range(cnum):
             # reference channel number
             if rnum == 1:
                 self.Dlist[dtwo].rname.append(self.Dlist[done].clist[0])
-                XX = self.Dlist[done].spdata[0,:,:]
             else:
                 self.Dlist[dtwo].rname.append(self.Dlist[done].clist[c])
-                XX = self.Dlist[done].spdata[c,:,:]
 
-            YY = self.Dlist[dtwo].spdata[c,:,:]
-
-            if self.Dlist[dtwo].ax[1] < 0: # full range
-                self.Dlist[dtwo].val[c,:] = sp.cross_power(XX, YY, self.Dlist[dtwo].win_factor, self.Dlist[dtwo].bidx)
-            else: # half
-                self.Dlist[dtwo].val[c,:] = 2*sp.cross_power(XX, YY, self.Dlist[dtwo].win_factor, self.Dlist[dtwo].bidx)  # product 2 for half return
+        if self.Dlist[dtwo].full == 0 or hasattr(self.Dlist[dtwo], 'fshift'): # half or demodulated (positive frequencies only)
+            self.Dlist[dtwo].val = 2*self.Dlist[dtwo].val  # product 2 for half return
 
     def coherence(self, done=0, dtwo=1):
         # IN : data number one (ref), data number two (cmp), etc
@@ -413,22 +707,19 @@ class FluctAna(object):
         # reference channel names
         self.Dlist[dtwo].rname = []
 
+        # bin averaged cross spectra
+        _, _, _, Gxy = self.cross_spec(done, dtwo)
+
         # value dimension
-        self.Dlist[dtwo].val = np.zeros((cnum, len(self.Dlist[dtwo].ax)))
+        self.Dlist[dtwo].val = np.abs(Gxy).real
 
         # calculation loop for multi channels
         for c in range(cnum):
             # reference channel names
             if rnum == 1:
                 self.Dlist[dtwo].rname.append(self.Dlist[done].clist[0])
-                XX = self.Dlist[done].spdata[0,:,:]
             else:
                 self.Dlist[dtwo].rname.append(self.Dlist[done].clist[c])
-                XX = self.Dlist[done].spdata[c,:,:]
-
-            YY = self.Dlist[dtwo].spdata[c,:,:]
-
-            self.Dlist[dtwo].val[c,:] = sp.coherence(XX, YY, self.Dlist[dtwo].bidx)
 
     def cross_phase(self, done=0, dtwo=1):
         # IN : data number one (ref), data number two (cmp)
@@ -446,8 +737,11 @@ class FluctAna(object):
         # distance
         self.Dlist[dtwo].dist = np.zeros(cnum)
 
+        # bin averaged cross spectra
+        Pxy, _, _, _ = self.cross_spec(done, dtwo)
+
         # value dimension
-        self.Dlist[dtwo].val = np.zeros((cnum, len(self.Dlist[dtwo].ax)))
+        self.Dlist[dtwo].val = np.arctan2(Pxy.imag, Pxy.real).real
 
         # calculation loop for multi channels
         for c in range(cnum):
@@ -456,16 +750,173 @@ class FluctAna(object):
                 self.Dlist[dtwo].rname.append(self.Dlist[done].clist[0])
                 self.Dlist[dtwo].dist[c] = np.sqrt((self.Dlist[dtwo].rpos[c] - self.Dlist[done].rpos[0])**2 + \
                 (self.Dlist[dtwo].zpos[c] - self.Dlist[done].zpos[0])**2)
-                XX = self.Dlist[done].spdata[0,:,:]
             else:
                 self.Dlist[dtwo].rname.append(self.Dlist[done].clist[c])
                 self.Dlist[dtwo].dist[c] = np.sqrt((self.Dlist[dtwo].rpos[c] - self.Dlist[done].rpos[c])**2 + \
                 (self.Dlist[dtwo].zpos[c] - self.Dlist[done].zpos[c])**2)
-                XX = self.Dlist[done].spdata[c,:,:]
 
-            YY = self.Dlist[dtwo].spdata[c,:,:]
+    def all_pairs(self, done=0, dtwo=1, vkind='coherence', frange=[0, 100], cube=1, pstep=32, nproc=1):
+        # IN : data number one (ref), data number two (cmp), vkind = 'coherence', 'cross_phase' or 'cross_power'
+        #      frange [kHz] of the band value val2, cube = 0 skips the rnum x cnum x faxis val
+        #      pairs in blocks of pstep channels, over nproc processes if nproc > 1
+        # OUT : val (rnum x cnum x faxis or, for cube = 0, rnum x cnum), val2 (rnum x cnum band value)
+        D1 = self.Dlist[done]
+        D2 = self.Dlist[dtwo]
+
+        D2.vkind = vkind + '_pairs'
+
+        rnum = len(D1.data)  # number of ref channels
+        cnum = len(D2.data)  # number of cmp channels
+        bidx = D2.bidx
+        bins = len(bidx)
+
+        # all ref channels for each cmp channel
+        D2.rname = D1.clist[:]
+
+        # frequency index of the band
+        pax = D2.ax/1000  # [kHz]
+        bfidx = np.where((pax >= frange[0])*(pax <= frange[1]))[0]
+        if cube == 1:
+            fidx = np.arange(len(pax))
+        else:
+            fidx = bfidx
+
+        # Hermitian symmetry for the same data set; only blocks with c1 >= r1
+        same = D1 is D2
+
+        # value dimension
+        Pxy = np.zeros((rnum, cnum, len(fidx)), dtype=np.complex_)
+
+        # process pool if nproc > 1; shut down on exit of the block
+        with (ProcessPoolExecutor(max_workers=nproc) if nproc > 1 else contextlib.nullcontext()) as pool:
+            # chunks of frequencies; a few temporaries of (rnum + cnum) x bins per frequency
+            fstep = sp.chunk_size(4*(rnum + cnum)*bins)
+            for f1 in range(0, len(fidx), fstep):
+                f2 = min(f1 + fstep, len(fidx))
+
+                # fftdata of nf x cnum x bins
+                XX = get_spcols(D1, bidx, fidx[f1:f2])
+                if vkind == 'coherence':
+                    XX = XX / np.abs(XX)
+                XX = np.ascontiguousarray(np.transpose(XX, (2,0,1)))
+                if same:
+                    YY = XX
+                else:
+                    YY = get_spcols(D2, bidx, fidx[f1:f2])
+                    if vkind == 'coherence':
+                        YY = YY / np.abs(YY)
+                    YY = np.ascontiguousarray(np.transpose(YY, (2,0,1)))
+
+                # pair blocks
+                blocks = []
+                for r1 in range(0, rnum, pstep):
+                    for c1 in range(0, cnum, pstep):
+                        if same and c1 < r1: continue
+                        blocks.append((r1, min(r1 + pstep, rnum), c1, min(c1 + pstep, cnum)))
+                jobs = [(XX[:,r1:r2,:], YY[:,c1:c2,:]) for r1, r2, c1, c2 in blocks]
+
+                if pool is not None:
+                    results = pool.map(pair_spec, jobs)
+                else:
+                    results = map(pair_spec, jobs)
+
+                for (r1, r2, c1, c2), G in zip(blocks, results):
+                    Pxy[r1:r2,c1:c2,f1:f2] = G
+                    if same and c1 > r1:
+                        Pxy[c1:c2,r1:r2,f1:f2] = np.conj(np.transpose(G, (1,0,2)))
+
+        # band index in the calculated frequencies
+        if cube == 1:
+            bsel = bfidx
+        else:
+            bsel = np.arange(len(fidx))
+
+        if vkind == 'cross_power':
+            val = np.abs(Pxy / D2.win_factor).real
+            if D2.full == 0 or hasattr(D2, 'fshift'): # half or demodulated (positive frequencies only)
+                val = 2*val  # product 2 for half return
+            val2 = np.sqrt(np.sum(val[:,:,bsel], 2))  # rms
+        elif vkind == 'coherence':
+            val = np.abs(Pxy).real
+            val2 = np.sum(val[:,:,bsel], 2)  # band integrated coherence
+        elif vkind == 'cross_phase':
+            val = np.arctan2(Pxy.imag, Pxy.real).real
+            Bxy = np.sum(Pxy[:,:,bsel], 2)
+            val2 = np.arctan2(Bxy.imag, Bxy.real).real  # phase of the band integrated cross spectrum
+
+        D2.val2 = val2
+        if cube == 1:
+            D2.val = val
+        else:
+            D2.val = val2
+
+    def sliding_spec(self, done=0, dtwo=1, wbins=20, wstep=1):
+        # IN : data number one (ref), data number two (cmp), number of bins in a window, window step in bins
+        # OUT : cnum x nwin x faxis coherence (val), cross power (power) and cross phase (phase); window time (wtime)
+        # window sums from cumulative sums over bins; add the new bin and subtract the old one
+        D1 = self.Dlist[done]
+        D2 = self.Dlist[dtwo]
+
+        D2.vkind = 'sliding_spec'
+
+        rnum = len(D1.data)  # number of ref channels
+        cnum = len(D2.data)  # number of cmp channels
+        bidx = D2.bidx
+        nfreq = len(D2.ax)
 
-            self.Dlist[dtwo].val[c,:] = sp.cross_phase(XX, YY, self.Dlist[dtwo].bidx)
+        # reference channel names
+        D2.rname = []
+        for c in range(cnum):
+            if rnum == 1:
+                D2.rname.append(D1.clist[0])
+            else:
+                D2.rname.append(D1.clist[c])
+
+        # windows
+        wbins = min(wbins, len(bidx))
+        widx = np.arange(0, len(bidx) - wbins + 1, wstep)  # first bin of windows
+        nwin = len(widx)
+        D2.wtime = np.array([np.mean(D2.btime[bidx[w:(w + wbins)]]) for w in widx])
+
+        # value dimension
+        Pxy = np.zeros((cnum, nwin, nfreq), dtype=np.complex_)
+        Gxy = np.zeros((cnum, nwin, nfreq), dtype=np.complex_)
+
+        # half storage of both; sums over 0 ~ fN and rebuild -fN ~ fN
+        half = hasattr(D1, 'half') and D1.half == 1 and hasattr(D2, 'half') and D2.half == 1
+
+        # blocks of channels; about sp.CHUNK_POINTS points in a temporary
+        cstep = sp.chunk_size(len(bidx)*nfreq)
+        for c1 in range(0, cnum, cstep):
+            c2 = min(c1 + cstep, cnum)
+            if rnum == 1:
+                cref = slice(0, 1)
+            else:
+                cref = slice(c1, c2)
+
+            if half:
+                XX = D1.spdata[cref,:,:][:,bidx,:]
+                YY = D2.spdata[c1:c2,:,:][:,bidx,:]
+            else:
+                XX = get_spdata(D1, cref)[:,bidx,:]
+                YY = get_spdata(D2, slice(c1, c2))[:,bidx,:]
+
+            Sxy = XX*np.conj(YY)
+            Nxy = Sxy / np.sqrt((XX*np.conj(XX)).real*(YY*np.conj(YY)).real)
+
+            # window averages
+            for S, P in [(Sxy, Pxy), (Nxy, Gxy)]:
+                S = np.cumsum(np.concatenate([np.zeros_like(S[:,0:1,:]), S], axis=1), axis=1, dtype=np.complex_)
+                S = (S[:,widx + wbins,:] - S[:,widx,:]) / wbins
+                if half:
+                    S = sp.full_layout(S)
+                P[c1:c2,:,:] = S
+
+        D2.val = np.abs(Gxy).real
+        D2.power = np.abs(Pxy / D2.win_factor).real
+        if D2.full == 0 or hasattr(D2, 'fshift'): # half or demodulated (positive frequencies only)
+            D2.power = 2*D2.power  # product 2 for half return
+        D2.phase = np.arctan2(Pxy.imag, Pxy.real).real
 
     def correlation(self, done=0, dtwo=1):
         # reguire full FFT
@@ -474,22 +925,11 @@ class FluctAna(object):
 
         rnum = len(self.Dlist[done].data)  # number of ref channels
         cnum = len(self.Dlist[dtwo].data)  # number of cmp channels
-        bins = self.Dlist[dtwo].bins  # number of bins
         nfft = self.Dlist[dtwo].nfft
         win_factor = self.Dlist[dtwo].win_factor  # window factors
 
         # reference channel names
         self.Dlist[dtwo].rname = []
-
-        # axes
-        fs = round(1/(self.Dlist[dtwo].time[1] - self.Dlist[dtwo].time[0])/1000)*1000.0
-        self.Dlist[dtwo].ax = int(nfft/2)*1.0/fs*np.linspace(1,-1,nfft)
-
-        # value dimension
-        val = np.zeros((bins, len(self.Dlist[dtwo].ax)), dtype=np.complex_)
-        self.Dlist[dtwo].val = np.zeros((cnum, len(self.Dlist[dtwo].ax)))
-
-        # calculation loop for multi channels
         for c in range(cnum):
             # reference channel number
             if rnum == 1:
@@ -497,24 +937,17 @@ class FluctAna(object):
             else:
                 self.Dlist[dtwo].rname.append(self.Dlist[done].clist[c])
 
-            # calculate cross power for each channel and each bins
-            for b in range(bins):
-                if rnum == 1:  # single reference channel
-                    X = self.Dlist[done].spdata[0,b,:]
-                else:  # number of ref channels = number of cmp channels
-                    X = self.Dlist[done].spdata[c,b,:]
-
-                Y = self.Dlist[dtwo].spdata[c,b,:]
+        # cross power averaged over bins (ifft is linear; average before ifft)
+        Pxy, _, _, _ = self.cross_spec(done, dtwo)
 
-                val[b,:] = np.fft.ifftshift(X*np.matrix.conjugate(Y) / win_factor)
-                val[b,:] = np.fft.ifft(val[b,:], n=nfft)*nfft
-                val[b,:] = np.fft.fftshift(val[b,:])
+        # axes
+        fs = round(1/(self.Dlist[dtwo].time[1] - self.Dlist[dtwo].time[0])/1000)*1000.0
+        self.Dlist[dtwo].ax = int(nfft/2)*1.0/fs*np.linspace(1,-1,nfft)
+        self.Dlist[dtwo].spkey = None  # frequency axis replaced; fftbins again before spectral methods
 
-            # average over bins
-            Cxy = np.mean(val, 0)
-            # result saved in val
-            self.Dlist[dtwo].val[c,:] = Cxy.real
-            # std saved in std
+        # result saved in val
+        Cxy = sp.ifft(np.fft.ifftshift(Pxy / win_factor, axes=-1), n=nfft, axis=-1)*nfft
+        self.Dlist[dtwo].val = np.fft.fftshift(Cxy, axes=-1).real
 
     def corr_coef(self, done=0, dtwo=1):
         # reguire full FFT
@@ -523,22 +956,12 @@ class FluctAna(object):
 
         rnum = len(self.Dlist[done].data)  # number of ref channels
         cnum = len(self.Dlist[dtwo].data)  # number of cmp channels
-        bins = self.Dlist[dtwo].bins  # number of bins
+        bidx = self.Dlist[dtwo].bidx  # index of bins
         nfft = self.Dlist[dtwo].nfft
         win_factor = self.Dlist[dtwo].win_factor  # window factors
 
         # reference channel names
         self.Dlist[dtwo].rname = []
-
-        # axes
-        fs = round(1/(self.Dlist[dtwo].time[1] - self.Dlist[dtwo].time[0])/1000)*1000.0
-        self.Dlist[dtwo].ax = int(nfft/2)*1.0/fs*np.linspace(1,-1,nfft)
-
-        # value dimension
-        val = np.zeros((bins, len(self.Dlist[dtwo].ax)), dtype=np.complex_)
-        self.Dlist[dtwo].val = np.zeros((cnum, len(self.Dlist[dtwo].ax)))
-
-        # calculation loop for multi channels
         for c in range(cnum):
             # reference channel number
             if rnum == 1:
@@ -546,31 +969,82 @@ class FluctAna(object):
             else:
                 self.Dlist[dtwo].rname.append(self.Dlist[done].clist[c])
 
-            # calculate cross power for each channel and each bins
-            for b in range(bins):
-                if rnum == 1:  # single reference channel
-                    X = self.Dlist[done].spdata[0,b,:]
-                else:  # number of ref channels = number of cmp channels
-                    X = self.Dlist[done].spdata[c,b,:]
+        # value dimension
+        Gxy = np.zeros((cnum, nfft), dtype=np.complex_)
+
+        # blocks of channels; about sp.CHUNK_POINTS points in a temporary
+        cstep = sp.chunk_size(len(bidx)*nfft)
+        for c1 in range(0, cnum, cstep):
+            c2 = min(c1 + cstep, cnum)
+            if rnum == 1:  # single reference channel
+                XX = get_spdata(self.Dlist[done], slice(0, 1))[:,bidx,:]
+            else:  # number of ref channels = number of cmp channels
+                XX = get_spdata(self.Dlist[done], slice(c1, c2))[:,bidx,:]
+            YY = get_spdata(self.Dlist[dtwo], slice(c1, c2))[:,bidx,:]
+
+            # mean(x**2) of the ifft of each bin; -f pairs with f on the full -fN ~ fN axis
+            Rxx = np.sum(XX*XX[:,:,::-1], -1) / win_factor
+            Ryy = np.sum(YY*YY[:,:,::-1], -1) / win_factor
+
+            # cross power of each bin normalized and averaged over bins
+            Gxy[c1:c2,:] = np.mean(XX*np.conj(YY) / win_factor / np.sqrt(Rxx*Ryy)[:,:,np.newaxis], 1)
+
+        # axes
+        fs = round(1/(self.Dlist[dtwo].time[1] - self.Dlist[dtwo].time[0])/1000)*1000.0
+        self.Dlist[dtwo].ax = int(nfft/2)*1.0/fs*np.linspace(1,-1,nfft)
+        self.Dlist[dtwo].spkey = None  # frequency axis replaced; fftbins again before spectral methods
 
-                Y = self.Dlist[dtwo].spdata[c,b,:]
+        # result saved in val
+        cxy = sp.ifft(np.fft.ifftshift(Gxy, axes=-1), n=nfft, axis=-1)*nfft
+        self.Dlist[dtwo].val = np.fft.fftshift(cxy, axes=-1).real
 
-                x = np.fft.ifft(np.fft.ifftshift(X), n=nfft)*nfft/np.sqrt(win_factor)
-                Rxx = np.mean(x**2)
-                y = np.fft.ifft(np.fft.ifftshift(Y), n=nfft)*nfft/np.sqrt(win_factor)
-                Ryy = np.mean(y**2)
+    def time_delay(self, done=0, dtwo=1, verbose=1):
+        # run after correlation or corr_coef
+        # IN : data number one (ref), data number two (cmp)
+        # OUT : lag [s] (positive = ref -> cmp), peak value and velocity [km/s] of each pair
+        # correlation peak refined to a sub-sample lag by a parabolic fit of three points
+        D1 = self.Dlist[done]
+        D2 = self.Dlist[dtwo]
 
-                val[b,:] = np.fft.ifftshift(X*np.matrix.conjugate(Y) / win_factor)
-                val[b,:] = np.fft.ifft(val[b,:], n=nfft)*nfft
-                val[b,:] = np.fft.fftshift(val[b,:])
+        if D2.vkind not in ['correlation','corr_coef']:
+            print('#### run correlation or corr_coef before time_delay ####')
+            return
 
-                val[b,:] = val[b,:]/np.sqrt(Rxx*Ryy)
+        rnum = len(D1.data)  # number of ref channels
+        cnum = len(D2.data)  # number of cmp channels
 
-            # average over bins
-            cxy = np.mean(val, 0)
-            # result saved in val
-            self.Dlist[dtwo].val[c,:] = cxy.real
-            # std saved in std
+        # distance between ref and cmp channels
+        if rnum == 1:
+            D2.dist = np.sqrt((D2.rpos - D1.rpos[0])**2 + (D2.zpos - D1.zpos[0])**2)
+        else:
+            D2.dist = np.sqrt((D2.rpos - D1.rpos)**2 + (D2.zpos - D1.zpos)**2)
+
+        # peak index (inner points for the fit)
+        val = D2.val
+        i = np.clip(np.argmax(val, 1), 1, val.shape[1] - 2)
+        c = np.arange(cnum)
+        y0 = val[c,i-1]
+        y1 = val[c,i]
+        y2 = val[c,i+1]
+
+        # vertex of the parabola through three points; offset in samples
+        den = y0 - 2*y1 + y2
+        di = np.zeros(cnum)
+        idx = den < 0
+        di[idx] = 0.5*(y0[idx] - y2[idx])/den[idx]
+
+        # ax is descending (linspace(1,-1))
+        dlag = D2.ax[1] - D2.ax[0]
+        D2.lag = D2.ax[i] + di*dlag
+        D2.peak = y1 - 0.25*(y0 - y2)*di
+
+        old_settings = np.seterr(divide='ignore')
+        D2.velocity = D2.dist/D2.lag/1000.0  # [km/s]
+        np.seterr(**old_settings)
+
+        if verbose == 1:
+            for c in range(cnum):
+                print('{:s}-{:s} lag {:g} us, peak {:g}, velocity {:g} km/s'.format(D2.rname[c], D2.clist[c], D2.lag[c]*1e6, D2.peak[c], D2.velocity[c]))
 
     # def xspec(self, done=0, cone=[0], dtwo=1, ctwo=[0], thres=0, **kwargs):
     def xspec(self, done=0, dtwo=1, thres=0, **kwargs):
@@ -617,8 +1091,8 @@ class FluctAna(object):
             pdata = np.zeros((bins, len(self.Dlist[dtwo].ax)))  # (full length for calculation)
 
             # calculate cross power for each channel and each bins
-            XX = self.Dlist[done].spdata[c,:,:]
-            YY = self.Dlist[dtwo].spdata[c,:,:]
+            XX = get_spdata(self.Dlist[done], c)
+            YY = get_spdata(self.Dlist[dtwo], c)
 
             pdata = sp.xspec(XX, YY, win_factor)
 
@@ -650,7 +1124,7 @@ class FluctAna(object):
 
         plt.show()
 
-    def skw(self, done=0, dtwo=1, kstep=0.01, **kwargs):
+    def skw(self, done=0, dtwo=1, kstep=0.01, verbose=1, **kwargs):
         # calculate for each pair of done and dtwo and average
         # number of cmp channels = number of ref channels
         # kstep [cm^-1]
@@ -680,47 +1154,56 @@ class FluctAna(object):
         nkax = len(kax)
         nfft = len(self.Dlist[dtwo].ax)
 
-        # value dimension
-        Pxx = np.zeros((bins, nfft), dtype=np.complex_)
-        Pyy = np.zeros((bins, nfft), dtype=np.complex_)
-        Kxy = np.zeros((bins, nfft), dtype=np.complex_)
-        val = np.zeros((cnum, nkax, nfft), dtype=np.complex_)
-        self.Dlist[dtwo].val = np.zeros((nkax, nfft))
-        sklw = np.zeros((nkax, nfft), dtype=np.complex_)
-        K = np.zeros((cnum, nfft), dtype=np.complex_)
-        sigK = np.zeros((cnum, nfft), dtype=np.complex_)
+        # edges of k cells; power is deposited where |K - kax| < kstep/2
+        kedge = np.append(kax - kstep/2.0, kax[-1] + kstep/2.0)
 
-        # calculation loop for multi channels
-        for c in range(cnum):
-            # reference channel name
-            self.Dlist[dtwo].rname.append(self.Dlist[done].clist[c])
-            print('pair of {:s} and {:s}'.format(self.Dlist[dtwo].rname[c], self.Dlist[dtwo].clist[c]))
-
-            # calculate auto power and cross phase (wavenumber)
-            for i,b in enumerate(bidx):
-                X = self.Dlist[done].spdata[c,b,:]
-                Y = self.Dlist[dtwo].spdata[c,b,:]
-
-                Pxx[i,:] = X*np.matrix.conjugate(X) / win_factor
-                Pyy[i,:] = Y*np.matrix.conjugate(Y) / win_factor
-                Pxy = X*np.matrix.conjugate(Y)
-                Kxy[i,:] = np.arctan2(Pxy.imag, Pxy.real).real / (self.Dlist[dtwo].dist[c]*100) # [cm^-1]
-
-                # calculate SKw
-                for w in range(nfft):
-                    idx = (Kxy[i,w] - kstep/2.0 < kax) * (kax < Kxy[i,w] + kstep/2.0)
-                    val[c,:,w] = val[c,:,w] + (1.0/bins*(Pxx[i,w] + Pyy[i,w])/2.0) * idx
-
-            # calculate moments
-            sklw = val[c,:,:] / np.tile(np.sum(val[c,:,:], 0), (nkax, 1))
-            K[c, :] = np.sum(np.transpose(np.tile(kax, (nfft, 1))) * sklw, 0)
-            for w in range(nfft):
-                sigK[c,w] = np.sqrt(np.sum( (kax - K[c,w])**2 * sklw[:,w] ))
-
-        self.Dlist[dtwo].val[:,:] = np.mean(val, 0).real
+        # value dimension
+        val = np.zeros((cnum, nkax, nfft))
+
+        # blocks of channels; about sp.CHUNK_POINTS points in a temporary
+        cstep = sp.chunk_size(len(bidx)*nfft)
+        for c1 in range(0, cnum, cstep):
+            c2 = min(c1 + cstep, cnum)
+            for c in range(c1, c2):
+                # reference channel name
+                self.Dlist[dtwo].rname.append(self.Dlist[done].clist[c])
+                if verbose == 1: print('pair of {:s} and {:s}'.format(self.Dlist[dtwo].rname[c], self.Dlist[dtwo].clist[c]))
+
+            # calculate auto power and cross phase (wavenumber) of all bins
+            XX = get_spdata(self.Dlist[done], slice(c1, c2))[:,bidx,:]
+            YY = get_spdata(self.Dlist[dtwo], slice(c1, c2))[:,bidx,:]
+
+            Pxx = (XX*np.conj(XX)).real / win_factor
+            Pyy = (YY*np.conj(YY)).real / win_factor
+            Pxy = XX*np.conj(YY)
+            Kxy = np.arctan2(Pxy.imag, Pxy.real) / (self.Dlist[dtwo].dist[c1:c2,np.newaxis,np.newaxis]*100) # [cm^-1]
+
+            # k cell of each (bin, frequency)
+            kidx = np.digitize(Kxy, kedge) - 1
+            kidx[(kidx < 0) | (kidx >= nkax)] = -1
+            good = kidx >= 0
+            good[good] = np.abs(kax[kidx[good]] - Kxy[good]) < kstep/2.0
+
+            # calculate SKw; histogram over flattened (pair, k, f) with the power as weights
+            pidx = np.arange(c2 - c1)[:,np.newaxis,np.newaxis] * np.ones(Kxy.shape, dtype=int)
+            fidx = np.arange(nfft)[np.newaxis,np.newaxis,:] * np.ones(Kxy.shape, dtype=int)
+            hidx = (pidx[good]*nkax + kidx[good])*nfft + fidx[good]
+            wval = 1.0/bins*(Pxx[good] + Pyy[good])/2.0
+            val[c1:c2,:,:] = np.bincount(hidx, weights=wval, minlength=(c2 - c1)*nkax*nfft).reshape((c2 - c1, nkax, nfft))
+
+        # calculate moments
+        old_settings = np.seterr(invalid='ignore', divide='ignore')
+        sklw = val / np.sum(val, 1, keepdims=True)
+        K = np.sum(kax[np.newaxis,:,np.newaxis] * sklw, 1)
+        sigK = np.sqrt(np.sum( (kax[np.newaxis,:,np.newaxis] - K[:,np.newaxis,:])**2 * sklw, 1 ))
+        np.seterr(**old_settings)
+
+        self.Dlist[dtwo].val = np.mean(val, 0)
         self.Dlist[dtwo].K = np.mean(K, 0)
         self.Dlist[dtwo].sigK = np.mean(sigK, 0)
 
+        if verbose == 0: return
+
         pshot = self.Dlist[dtwo].shot
         pfreq = self.Dlist[dtwo].ax/1000
         pdata = self.Dlist[dtwo].val + 1e-10
@@ -742,9 +1225,112 @@ class FluctAna(object):
 
         plt.show()
 
-    def bicoherence(self, done=0, dtwo=1, cnl=[0], **kwargs):
+    def kf_spec(self, dnum=0, cnl=None, method='fft', kstep=0.01, nsig=1, verbose=1, **kwargs):
+        # S(k,f) of an array of channels (an ECEI column or row); cnl = None for all channels
+        # method = 'fft' (spatial FFT of uniformly spaced channels), 'bartlett' (beamforming) or 'music'
+        # kstep [cm^-1], nsig = number of signal modes for music
+        # position s along the array increases with R for a row and with z for a column (k > 0 as skw)
+        D = self.Dlist[dnum]
+
+        D.vkind = 'kf_spec'
+
+        if cnl is None:
+            cnl = range(len(D.clist))
+        cnl = np.array(cnl)
+
+        # position along the array [cm]
+        pos = np.vstack([D.rpos[cnl], D.zpos[cnl]]).T*100
+        pos = pos - np.mean(pos, 0)
+        _, _, vh = np.linalg.svd(pos)
+        sdir = vh[0]  # array direction; the sign of the singular vector is arbitrary
+        if sdir[np.argmax(np.abs(sdir))] < 0:
+            sdir = -sdir
+        spos = np.dot(pos, sdir)  # projection on the array direction
+
+        # sort channels along the array
+        sidx = np.argsort(spos)
+        cnl = cnl[sidx]
+        spos = spos[sidx] - spos[sidx][0]
+        cnum = len(cnl)
+
+        dpos = np.diff(spos)
+        if cnum < 2 or dpos.min() <= 0:
+            print('#### channels for kf_spec must be at distinct positions along a line ####')
+            return
+
+        # uniform spacing for fft
+        uniform = np.abs(dpos - np.mean(dpos)).max() < 1e-3*np.mean(dpos)
+        if method == 'fft' and not uniform:
+            print('#### channels are not uniformly spaced; bartlett instead of fft ####')
+            method = 'bartlett'
+
+        bidx = D.bidx
+        win_factor = D.win_factor
+        XX = get_spdata(D, cnl)[:,bidx,:]  # cnum x bins x faxis
+        nfreq = XX.shape[-1]
+
+        if method == 'fft':
+            # k-axis of the zero padded spatial FFT
+            dk = np.mean(dpos)
+            nk = max(cnum, int(np.ceil(2*np.pi/(dk*kstep))))
+            kax = np.fft.fftshift(2*np.pi*np.fft.fftfreq(nk, d=dk))  # [cm^-1]
+
+            # sum_j X_j exp(i k s_j) for all bins in one transform; average power over bins
+            val = np.zeros((nk, nfreq))
+            bstep = sp.chunk_size(nk*nfreq)
+            for b1 in range(0, len(bidx), bstep):
+                B = sp.ifft(XX[:,b1:(b1 + bstep),:], n=nk, axis=0)*nk
+                val += np.sum((B*np.conj(B)).real, 1)
+            val = np.fft.fftshift(val, axes=0) / len(bidx) / win_factor / cnum**2
+        else:
+            # k-axis
+            kax = np.arange(-np.pi/dpos.min(), np.pi/dpos.min(), kstep)  # [cm^-1]
+            nk = len(kax)
+
+            # cross spectral matrix of faxis x cnum x cnum averaged over bins
+            Rxx = np.matmul(np.transpose(XX, (2,0,1)), np.conj(np.transpose(XX, (2,1,0)))) / len(bidx) / win_factor
+
+            # steering vectors of cnum x nk
+            A = np.exp(-1.0j*spos[:,np.newaxis]*kax[np.newaxis,:])
+
+            if method == 'bartlett':
+                RA = np.matmul(Rxx, A)  # faxis x cnum x nk
+                val = np.sum(np.conj(A)[np.newaxis,:,:]*RA, 1).real.T / cnum**2
+            elif method == 'music':
+                # noise subspace of the smallest cnum - nsig eigenvalues
+                _, E = np.linalg.eigh(Rxx)
+                En = E[:,:,0:(cnum - nsig)]
+                EA = np.matmul(np.conj(np.transpose(En, (0,2,1))), A)  # faxis x (cnum - nsig) x nk
+                val = 1.0/np.sum((EA*np.conj(EA)).real, 1).T
+
+        D.kax = kax
+        D.kf_method = method
+        D.val = val
+
+        if verbose == 0: return
+
+        pshot = D.shot
+        pfreq = D.ax/1000
+        pdata = np.log10(D.val + 1e-10)
+
+        plt.imshow(pdata, extent=(pfreq.min(), pfreq.max(), kax.min(), kax.max()), interpolation='none', aspect='auto', origin='lower', cmap=CM)
+
+        plt.colorbar()
+
+        if 'flimits' in kwargs: plt.xlim([kwargs['flimits'][0], kwargs['flimits'][1]])
+        if 'klimits' in kwargs: plt.ylim([kwargs['klimits'][0], kwargs['klimits'][1]])
+
+        chpos = '({:.1f}, {:.1f})'.format(np.mean(D.rpos[cnl]*100), np.mean(D.zpos[cnl]*100)) # [cm]
+        plt.title('#{:d}, {:s} {:s}'.format(pshot, chpos, method), fontsize=10)
+        plt.xlabel('Frequency [kHz]')
+        plt.ylabel('Wavenumber [rad/cm]')
+
+        plt.show()
+
+    def bicoherence(self, done=0, dtwo=1, cnl=[0], f1range=None, f2range=None, triads=None, **kwargs):
         # fftbins full = 1
         # number of cmp channels = number of ref channels
+        # f1range, f2range = [fmin, fmax] or triads = [(f1, f2), ...] ; only in the region of interest (NaN out of it)
         self.Dlist[dtwo].vkind = 'bicoherence'
 
         rnum = len(self.Dlist[done].data)  # number of ref channels
@@ -766,6 +1352,9 @@ class FluctAna(object):
         ax2 = np.fft.ifftshift(self.Dlist[dtwo].ax) # full 0 ~ fN, -fN ~ -f1
         ax2 = ax2[0:int(len(ax1)/2+1)] # half 0 ~ fN
 
+        # region of interest
+        roi = sp.roi_index(ax1, f1range, f2range, triads)
+
         # value dimension
         self.Dlist[dtwo].val = np.zeros((cnum, len(ax1), len(ax2)))
         self.Dlist[dtwo].val2 = np.zeros((cnum, len(ax1)))
@@ -775,18 +1364,21 @@ class FluctAna(object):
             # reference channel
             if rnum == 1:
                 rname = self.Dlist[done].clist[0]
-                XX = self.Dlist[done].spdata[0,:,:]
+                XX = get_spdata(self.Dlist[done], 0)
             else:
                 rname = self.Dlist[done].clist[c]
-                XX = self.Dlist[done].spdata[c,:,:]
+                XX = get_spdata(self.Dlist[done], c)
             self.Dlist[dtwo].rname.append(rname)
 
             # cmp channel
             pname = self.Dlist[dtwo].clist[c]
-            YY = self.Dlist[dtwo].spdata[c,:,:]
+            if done == dtwo:
+                YY = XX # auto bicoherence
+            else:
+                YY = get_spdata(self.Dlist[dtwo], c)
 
             # calculate bicoherence
-            self.Dlist[dtwo].val[c,:,:], self.Dlist[dtwo].val2[c,:] = sp.bicoherence(XX, YY, bidx)
+            self.Dlist[dtwo].val[c,:,:], self.Dlist[dtwo].val2[c,:] = sp.bicoherence(XX, YY, bidx, roi)
 
             # plot info
             pshot = self.Dlist[dtwo].shot
@@ -818,7 +1410,8 @@ class FluctAna(object):
 
             plt.show()
 
-    def nonlin_evolution(self, done=0, dtwo=1, delta=1.0, wit=1, js=1, test=0, **kwargs):
+    def nonlin_evolution(self, done=0, dtwo=1, delta=1.0, wit=1, js=1, test=0, f1range=None, f2range=None, triads=None, **kwargs):
+        # f1range, f2range = [fmin, fmax] or triads = [(f1, f2), ...] ; quadratic terms only in the region of interest
         if 'xlimits' in kwargs: xlimits = kwargs['xlimits']
 
         self.Dlist[dtwo].vkind = 'nonlin_rates'
@@ -844,11 +1437,11 @@ class FluctAna(object):
         # obtain XX and YY
         # reference channel
         rname = self.Dlist[done].clist[0]
-        XX = self.Dlist[done].spdata[0,:,:]
+        XX = get_spdata(self.Dlist[done], 0)
         self.Dlist[dtwo].rname.append(rname)
         # cmp channel
         pname = self.Dlist[dtwo].clist[0]
-        YY = self.Dlist[dtwo].spdata[0,:,:]
+        YY = get_spdata(self.Dlist[dtwo], 0)
 
         # # check bicoherence
         # self.bicoherence(done, dtwo, cnl=[0])
@@ -859,13 +1452,16 @@ class FluctAna(object):
             YY, _, _ = sp.nonlinear_test(ax1, XX)
             print('TEST with MODEL DATA')
 
+        # region of interest
+        roi = sp.roi_index(ax1, f1range, f2range, triads)
+
         # calculate transfer functions
         if wit == 0:
             print('Ritz method')
-            Lk, Qijk, Bk, Aijk = sp.ritz_nonlinear(XX, YY)
+            Lk, Qijk, Bk, Aijk = sp.ritz_nonlinear(XX, YY, roi)
         else:
             print('Wit method')
-            Lk, Qijk, Bk, Aijk = sp.wit_nonlinear(XX, YY, bidx)
+            Lk, Qijk, Bk, Aijk = sp.wit_nonlinear(XX, YY, bidx, roi)
 
         # plot info
         pshot = self.Dlist[dtwo].shot
@@ -1656,6 +2252,80 @@ class FluctAna(object):
 
         D.pdata = pdata
 
+    def movie(self, dnum=0, fname='ecei_movie.mp4', snum=0, tstep=1, vlimits=[-0.1, 0.1], istep=0.002, imethod='cubic', bcut=0.03, fps=30, dpi=100, nproc=1):
+        # offscreen ECE image movie; no interaction and no screen
+        # frames are rendered over nproc processes and saved in the directory of fname without extension
+        # fname = *.mp4, *.avi, *.mov, *.gif : frames are combined into a video by ffmpeg
+        D = self.Dlist[dnum]
+
+        fdir, ext = os.path.splitext(fname)
+
+        # take data of all frames and fill bad channel
+        tidx = np.arange(0, len(D.time), tstep)
+        fnum = len(tidx)
+        if fnum == 0:
+            print('#### no frames for the movie ####')
+            return
+
+        # frames of an earlier run are removed
+        if not os.path.isdir(fdir):
+            os.makedirs(fdir)
+        for f in os.listdir(fdir):
+            if f.startswith('frame_') and f.endswith('.png'):
+                os.remove(os.path.join(fdir, f))
+
+        pdata = D.data[:,tidx]
+        if hasattr(D, 'good_channels'):
+            pdata = ms.fill_bad_channel(pdata, D.rpos, D.zpos, D.good_channels, bcut)
+
+        # interpolation weights
+        if istep > 0:
+            ipdata = ms.get_interp(D.rpos, D.zpos, istep, imethod)
+        else:
+            ipdata = None
+
+        # time trace of the snum channel; min and max of blocks for about 2000 points on the plot
+        tstride = int(np.ceil(len(D.time)/1000.0))
+        tnum = int(len(D.time)/tstride)*tstride
+        ptime = np.repeat(D.time[0:tnum:tstride], 2)
+        psdata = D.data[snum,0:tnum].reshape((-1, tstride))
+        psdata = np.stack((np.min(psdata, 1), np.max(psdata, 1)), 1).ravel()
+
+        # split frames; each job takes the time and data of its frames only
+        # the common part (interpolation weights, time trace) is passed once to each worker
+        fchunk = int(np.ceil(fnum/(4.0*nproc)))
+        jobs = []
+        for i1 in range(0, fnum, fchunk):
+            i2 = min(i1 + fchunk, fnum)
+            jobs.append((i1, D.time[tidx[i1:i2]], pdata[:,i1:i2]))
+        common = (fdir, ipdata, D.rpos, D.zpos, ptime, psdata, vlimits, dpi)
+
+        # render frames
+        if nproc > 1:
+            with ProcessPoolExecutor(max_workers=nproc, initializer=init_render, initargs=(common,)) as pool:
+                for i2 in pool.map(render_frames, jobs):
+                    print('movie frames: {:d}/{:d} done'.format(i2, fnum))
+        else:
+            init_render(common)
+            for job in jobs:
+                i2 = render_frames(job)
+                print('movie frames: {:d}/{:d} done'.format(i2, fnum))
+            RENDER.clear()
+
+        # make a video
+        if ext in ['.mp4', '.avi', '.mov', '.gif']:
+            cmd = [plt.rcParams['animation.ffmpeg_path'], '-y', '-loglevel', 'error', '-framerate', str(fps),
+                   '-i', os.path.join(fdir, 'frame_%06d.png')]
+            if ext != '.gif':
+                cmd += ['-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-pix_fmt', 'yuv420p']
+            try:
+                subprocess.check_call(cmd + [fname])
+                print('movie {:s} with {:d} frames'.format(fname, fnum))
+            except (OSError, subprocess.CalledProcessError):
+                print('#### ffmpeg failed; frames are in {:s} ####'.format(fdir))
+        else:
+            print('movie frames are in {:s}'.format(fdir))
+
 ############################# test functions ###################################
 
     def fftbins_bicoh_test(self, nfft, window, overlap, detrend, full=1):
@@ -1739,6 +2409,12 @@ class FluctAna(object):
             self.Dlist[dnum].detrend = detrend
             self.Dlist[dnum].bins = bins
             self.Dlist[dnum].win_factor = np.mean(win**2)
+            self.Dlist[dnum].full = full
+            self.Dlist[dnum].half = 0
+
+            # test data replaced the time series
+            touch_data(self.Dlist[dnum])
+            self.Dlist[dnum].spkey = None
 
             print('TEST :: dnum {:d} fftbins {:d} with {:s} size {:d} overlap {:g} detrend {:d} full {:d}'.format(dnum, bins, window, nfft, overlap, detrend, full))
 
@@ -1778,3 +2454,96 @@ def nextpow2(i):
     n = 1
     while n < i: n *= 2
     return n
+
+
+# common part of the movie frames in a render process; set by init_render
+RENDER = {}
+
+
+def init_render(common):
+    # IN : (frame directory, interpolation weights, rpos, zpos, time, sdata, vlimits, dpi)
+    RENDER['common'] = common
+
+
+def render_frames(job):
+    # render ECE image frames offscreen (used by FluctAna.movie)
+    # artists are made once and updated for each frame
+    fnum1, ftime, pdata = job
+    fdir, ipdata, rpos, zpos, time, sdata, vlimits, dpi = RENDER['common']
+
+    fig = Figure(facecolor='w', figsize=(5,10))
+    FigureCanvasAgg(fig)
+    ax1 = fig.add_axes([0.1, 0.77, 0.7, 0.2])  # [left bottom width height]
+    ax2 = fig.add_axes([0.1, 0.07, 0.7, 0.60])
+    ax3 = fig.add_axes([0.83, 0.07, 0.03, 0.6])
+
+    ax1.plot(time, sdata)
+    tline = ax1.axvline(x=ftime[0], color='g')
+
+    if ipdata is not None:
+        pi = ipdata.apply(pdata)
+        ext = (ipdata.ri.min(), ipdata.ri.max(), ipdata.zi.min(), ipdata.zi.max())
+        im = ax2.imshow(pi[0], extent=ext, origin='lower', interpolation='none', vmin=vlimits[0], vmax=vlimits[1], cmap=CM)
+    else:
+        im = ax2.scatter(rpos, zpos, 500, pdata[:,0], marker='s', vmin=vlimits[0], vmax=vlimits[1], cmap=CM, edgecolors='none')
+    ax2.set_aspect('equal')
+    fig.colorbar(im, cax=ax3)
+
+    ax2.set_xlabel('R [m]')
+    ax2.set_ylabel('z [m]')
+    title = ax2.set_title('')
+
+    for i, t in enumerate(ftime):
+        tline.set_xdata([t, t])
+        if ipdata is not None:
+            im.set_data(pi[i])
+        else:
+            im.set_array(pdata[:,i])
+        title.set_text('ECE image at t = {:g} sec'.format(t))
+
+        fig.savefig(os.path.join(fdir, 'frame_{:06d}.png'.format(fnum1 + i)), dpi=dpi)
+
+    return fnum1 + len(ftime)
+
+def get_spdata(D, c):
+    # IN : data set, channel number
+    # OUT : bins x faxis fftdata; the full range is rebuilt from the stored 0 ~ fN for half storage
+    if hasattr(D, 'half') and D.half == 1:
+        return sp.full_layout(D.spdata[c,:,:])
+    else:
+        return D.spdata[c,:,:]
+
+
+def get_spcols(D, bidx, fidx):
+    # IN : data set, index of bins, index of the full range frequency axis
+    # OUT : cnum x len(bidx) x len(fidx) fftdata; rebuilt from the stored 0 ~ fN for half storage
+    if hasattr(D, 'half') and D.half == 1:
+        nh = D.spdata.shape[-1]
+        S = D.spdata[:,bidx[:,np.newaxis],np.abs(fidx - (nh - 1))]
+        neg = fidx < nh - 1
+        S[:,:,neg] = np.conj(S[:,:,neg])
+        return S
+    else:
+        return D.spdata[:,bidx[:,np.newaxis],fidx]
+
+
+def pair_spec(job):
+    # IN : nf x rnum x bins ref fftdata, nf x cnum x bins cmp fftdata
+    # OUT : rnum x cnum x nf bin averages of X Y*
+    XX, YY = job
+    G = np.matmul(XX, np.conj(np.transpose(YY, (0,2,1)))) / XX.shape[2]
+
+    return np.transpose(G, (1,2,0))
+
+
+def touch_data(D):
+    # bump the version of the data set after its time series are modified
+    # transforms (fftbins, cwt) are recomputed only for data sets with a new version
+    D.version = data_version(D) + 1
+
+
+def data_version(D):
+    if hasattr(D, 'version'):
+        return D.version
+    else:
+        return 0
@@ -1,9 +1,14 @@
 import numpy as np
 from scipy.interpolate import griddata
+from scipy import sparse
 
 # functions to massage the raw data including data from bad channels.
 
+# bad channel operators already made; (rpos, zpos, good_channels, cutoff) -> (bad channel index, weights)
+FILL_CACHE = {}
+
 def fill_bad_channel(pdata, rpos, zpos, good_channels, cutoff):
+    # pdata : 1 x cnum (a frame) or cnum x tnum (all frames)
     # cutoff = 0.003 [m]
     # ## fake data
     # dist = np.sqrt((rpos - 1.8)**2 + (zpos - 0)**2)
@@ -14,22 +19,83 @@ def fill_bad_channel(pdata, rpos, zpos, good_channels, cutoff):
     pdata[np.isnan(pdata)] = 0
     
     # recovery
-    for c in range(pdata.size):
-        if good_channels[c] == 0:
-            dist = np.sqrt((rpos - rpos[c])**2 + (zpos - zpos[c])**2)
-            dfct = np.exp(-2*(dist/cutoff)**4) * good_channels
-            pdata[c] = np.sum(pdata * dfct)/np.sum(dfct)
+    bidx, W = bad_channel_operator(rpos, zpos, good_channels, cutoff)
+    if len(bidx) > 0:
+        pdata[bidx] = np.dot(W, pdata)
 
     return pdata
 
+def bad_channel_operator(rpos, zpos, good_channels, cutoff):
+    # OUT : index of bad channels, nbad x cnum weights on the good channels
+    rpos = np.asarray(rpos, dtype=np.float64)
+    zpos = np.asarray(zpos, dtype=np.float64)
+    good_channels = np.asarray(good_channels, dtype=np.float64)
+
+    key = (rpos.tobytes(), zpos.tobytes(), good_channels.tobytes(), cutoff)
+    if key not in FILL_CACHE:
+        bidx = np.where(good_channels == 0)[0]
+
+        dist = np.sqrt((rpos[np.newaxis,:] - rpos[bidx,np.newaxis])**2 + (zpos[np.newaxis,:] - zpos[bidx,np.newaxis])**2)
+        dfct = np.exp(-2*(dist/cutoff)**4) * good_channels
+        W = dfct / np.sum(dfct, 1)[:,np.newaxis]
+
+        FILL_CACHE[key] = (bidx, W)
+
+    return FILL_CACHE[key]
+
+# image interpolators already made; (rpos, zpos, istep, imethod) -> PdataInterp
+INTERP_CACHE = {}
+
 def interp_pdata(pdata, rpos, zpos, istep, imethod):
     # interpolation
     # istep = 0.002
     # imethod = 'cubic'
+    ipdata = get_interp(rpos, zpos, istep, imethod)
+
+    return ipdata.ri, ipdata.zi, ipdata.apply(pdata)
+
+def get_interp(rpos, zpos, istep, imethod):
+    # OUT : PdataInterp made once for each set of arguments
+    rpos = np.asarray(rpos, dtype=np.float64)
+    zpos = np.asarray(zpos, dtype=np.float64)
+
+    key = (rpos.tobytes(), zpos.tobytes(), istep, imethod)
+    if key not in INTERP_CACHE:
+        INTERP_CACHE[key] = PdataInterp(rpos, zpos, istep, imethod)
+
+    return INTERP_CACHE[key]
+
+
+class PdataInterp(object):
+    def __init__(self, rpos, zpos, istep, imethod):
+        # interpolation weights of the channels on the (ri, zi) grid
+        # made once by interpolating the unit data of each channel (triangulation of channel positions is reused)
+        ri = np.arange(np.min(rpos), np.max(rpos), istep)
+        zi = np.arange(np.min(zpos), np.max(zpos), istep)
+        self.ri, self.zi = np.meshgrid(ri, zi)
+
+        cnum = len(rpos)
+        W = griddata((rpos,zpos),np.eye(cnum),(self.ri,self.zi),method=imethod)
+        W = W.reshape((-1, cnum))
+
+        # outside of the channel positions
+        self.nidx = np.isnan(W[:,0])
+        W[self.nidx,:] = 0
+
+        # sparse for the local (linear, nearest) weights
+        W[np.abs(W) < 1e-12] = 0
+        if np.count_nonzero(W) < 0.25*W.size:
+            self.W = sparse.csr_matrix(W)
+        else:
+            self.W = W
 
-    ri = np.arange(np.min(rpos), np.max(rpos), istep)
-    zi = np.arange(np.min(zpos), np.max(zpos), istep)
-    ri, zi = np.meshgrid(ri, zi)
-    pi = griddata((rpos,zpos),pdata,(ri,zi),method=imethod)
+    def apply(self, pdata):
+        # pdata : 1 x cnum (a frame) or cnum x fnum (frames)
+        # OUT : zi x ri image or fnum x zi x ri images
+        pi = self.W.dot(pdata)
+        pi[self.nidx] = np.nan
 
-    return ri, zi, pi
\ No newline at end of file
+        if pi.ndim == 1:
+            return pi.reshape(self.ri.shape)
+        else:
+            return pi.T.reshape((-1,) + self.ri.shape)
@@ -1,10 +1,79 @@
 import time
+import os
+import pickle
 
 import numpy as np
 from scipy import signal
+import scipy.fft
 
 import matplotlib.pyplot as plt
 
+try:
+    import pyfftw
+    import pyfftw.interfaces.scipy_fft
+except ImportError:
+    pyfftw = None
+
+# FFT backend of the transforms; select with set_fft_backend()
+FFT_BACKEND = {'name':'numpy', 'workers':1}
+
+def set_fft_backend(name='numpy', workers=1):
+    # IN : name = 'numpy', 'scipy' (multi-worker), 'pyfftw' (FFTW with plan cache), workers = -1 for all cores
+    if name == 'pyfftw' and pyfftw is None:
+        print('#### pyfftw is not installed; use scipy backend ####')
+        name = 'scipy'
+    if workers < 1:
+        workers = os.cpu_count()
+
+    if name == 'pyfftw':
+        pyfftw.interfaces.cache.enable()  # keep FFTW plans of repeated transforms
+        pyfftw.interfaces.cache.set_keepalive_time(60)
+
+    FFT_BACKEND['name'] = name
+    FFT_BACKEND['workers'] = workers
+
+    print('FFT backend {:s} with {:d} workers'.format(name, workers))
+
+
+# points in a temporary of the chunked (blocks of channels, bins, ...) calculations
+CHUNK_POINTS = 2**24
+
+def chunk_size(points):
+    # IN : points of the temporaries per step of the chunked axis
+    # OUT : steps in a chunk of about CHUNK_POINTS points
+    return max(1, int(CHUNK_POINTS/max(1, points)))
+
+
+def fft(x, n=None, axis=-1):
+    if FFT_BACKEND['name'] == 'scipy':
+        return scipy.fft.fft(x, n=n, axis=axis, workers=FFT_BACKEND['workers'])
+    elif FFT_BACKEND['name'] == 'pyfftw':
+        return pyfftw.interfaces.scipy_fft.fft(x, n=n, axis=axis, workers=FFT_BACKEND['workers'])
+    else:
+        return np.fft.fft(x, n=n, axis=axis)
+
+
+def ifft(x, n=None, axis=-1):
+    if FFT_BACKEND['name'] == 'scipy':
+        return scipy.fft.ifft(x, n=n, axis=axis, workers=FFT_BACKEND['workers'])
+    elif FFT_BACKEND['name'] == 'pyfftw':
+        return pyfftw.interfaces.scipy_fft.ifft(x, n=n, axis=axis, workers=FFT_BACKEND['workers'])
+    else:
+        return np.fft.ifft(x, n=n, axis=axis)
+
+
+def rfft(x, n=None, axis=-1):
+    if FFT_BACKEND['name'] == 'scipy':
+        return scipy.fft.rfft(x, n=n, axis=axis, workers=FFT_BACKEND['workers'])
+    elif FFT_BACKEND['name'] == 'pyfftw':
+        return pyfftw.interfaces.scipy_fft.rfft(x, n=n, axis=axis, workers=FFT_BACKEND['workers'])
+    else:
+        return np.fft.rfft(x, n=n, axis=axis)
+
+
+# fft plans already made; (window, nfft, overlap) -> FftPlan
+PLAN_CACHE = {}
+
 def fft_window(tnum, nfft, window, overlap):
     # IN : full length of time series, nfft, window name, overlap ratio
     # OUT : bins, 1 x nfft window function
@@ -13,30 +82,76 @@ def fft_window(tnum, nfft, window, overlap):
     bins = int(np.fix((int(tnum/nfft) - overlap)/(1.0 - overlap)))
 
     # window function
-    if window == 'rectwin':  # overlap = 0.5
-        win = np.ones(nfft)
-    elif window == 'hann':  # overlap = 0.5
-        win = np.hanning(nfft)
-    elif window == 'hamm':  # overlap = 0.5
-        win = np.hamming(nfft)
-    elif window == 'kaiser':  # overlap = 0.62
-        win = np.kaiser(nfft, beta=30)
-    elif window == 'HFT248D':  # overlap = 0.84
-        z = 2*np.pi/nfft*np.arange(0,nfft)
-        win = 1 - 1.985844164102*np.cos(z) + 1.791176438506*np.cos(2*z) - 1.282075284005*np.cos(3*z) + \
-            0.667777530266*np.cos(4*z) - 0.240160796576*np.cos(5*z) + 0.056656381764*np.cos(6*z) - \
-            0.008134974479*np.cos(7*z) + 0.000624544650*np.cos(8*z) - 0.000019808998*np.cos(9*z) + \
-            0.000000132974*np.cos(10*z)
+    win = fft_plan(nfft, window, overlap).win
 
     return bins, win
 
 
+def fft_plan(nfft, window, overlap):
+    # OUT : FftPlan made once for each set of arguments
+    key = (window, nfft, overlap)
+    if key not in PLAN_CACHE:
+        PLAN_CACHE[key] = FftPlan(nfft, window, overlap)
+
+    return PLAN_CACHE[key]
+
+
+class FftPlan(object):
+    def __init__(self, nfft, window, overlap):
+        self.nfft = nfft
+        self.window = window
+        self.overlap = overlap
+
+        # window function
+        self.win = self.window_function(nfft, window)
+        self.win.flags.writeable = False
+        self.win_factor = np.mean(self.win**2)  # window factors
+
+        # segment step
+        self.step = int(np.fix(nfft*(1 - overlap)))
+
+        # orthonormal basis of constant and linear trends (nfft x 2)
+        self.Q, _ = np.linalg.qr(np.vstack([np.ones(nfft), np.arange(nfft)]).T)
+        self.Q.flags.writeable = False
+
+    def window_function(self, nfft, window):
+        if window == 'rectwin':  # overlap = 0.5
+            win = np.ones(nfft)
+        elif window == 'hann':  # overlap = 0.5
+            win = np.hanning(nfft)
+        elif window == 'hamm':  # overlap = 0.5
+            win = np.hamming(nfft)
+        elif window == 'kaiser':  # overlap = 0.62
+            win = np.kaiser(nfft, beta=30)
+        elif window == 'HFT248D':  # overlap = 0.84
+            z = 2*np.pi/nfft*np.arange(0,nfft)
+            win = 1 - 1.985844164102*np.cos(z) + 1.791176438506*np.cos(2*z) - 1.282075284005*np.cos(3*z) + \
+                0.667777530266*np.cos(4*z) - 0.240160796576*np.cos(5*z) + 0.056656381764*np.cos(6*z) - \
+                0.008134974479*np.cos(7*z) + 0.000624544650*np.cos(8*z) - 0.000019808998*np.cos(9*z) + \
+                0.000000132974*np.cos(10*z)
+
+        return win
+
+    def detrend(self, sx, detrend):
+        # IN : ... x nfft segments, detrend = 1 (linear), 0 (mean), -1 (none)
+        # OUT : ... x nfft detrended segments
+        if detrend == 1:  # remove the projection on the trend basis
+            sx = sx - np.dot(np.dot(sx, self.Q), self.Q.T)
+        elif detrend == 0:  # subtract mean
+            sx = sx - np.mean(sx, axis=-1, keepdims=True)
+        elif detrend != -1:
+            raise ValueError('detrend = {} is not supported; use 1 (linear), 0 (mean) or -1 (none)'.format(detrend))
+
+        return sx
+
+
 def fftbins(x, dt, nfft, window, overlap, detrend, full):
-    # IN : 1 x tnum data
-    # OUT : bins x faxis fftdata
-    tnum = len(x)
+    # IN : 1 x tnum data or cnum x tnum data
+    # OUT : bins x faxis fftdata or cnum x bins x faxis fftdata
+    tnum = x.shape[-1]
+    plan = fft_plan(nfft, window, overlap)
     bins, win = fft_window(tnum, nfft, window, overlap)
-    win_factor = np.mean(win**2)  # window factors
+    win_factor = plan.win_factor
 
     # make an x-axis #
     ax = np.fft.fftfreq(nfft, d=dt) # full 0~fN -fN~-f1
@@ -47,99 +162,152 @@ def fftbins(x, dt, nfft, window, overlap, detrend, full):
     else: # half 0~fN
         ax = ax[0:int(nfft/2+1)]
 
-    # make fftdata
-    if full == 1: # full shift to -fN ~ 0 ~ fN
-        if np.mod(nfft, 2) == 0:  # even nfft
-            fftdata = np.zeros((bins, nfft+1), dtype=np.complex_)
-        else:  # odd nfft
-            fftdata = np.zeros((bins, nfft), dtype=np.complex_)
-    else: # half 0 ~ fN
-        fftdata = np.zeros((bins, int(nfft/2+1)), dtype=np.complex_)
+    # segments of all channels (strided views; no copy)
+    step = plan.step
+    sx = np.lib.stride_tricks.as_strided(x, shape=x.shape[:-1] + (bins, nfft),
+        strides=x.strides[:-1] + (step*x.strides[-1], x.strides[-1]), writeable=False)
 
-    for b in range(bins):
-        idx1 = int(b*np.fix(nfft*(1 - overlap)))
-        idx2 = idx1 + nfft
-
-        sx = x[idx1:idx2]
-
-        if detrend == 1:
-            sx = signal.detrend(sx, type='linear')
-        sx = signal.detrend(sx, type='constant')  # subtract mean
+    sx = plan.detrend(sx, detrend)  # detrend = -1 for no detrending
 
-        sx = sx * win  # apply window function
+    sx = sx * win  # apply window function
 
-        # get fft
-        SX = np.fft.fft(sx, n=nfft)/nfft  # divide by the length
-        if np.mod(nfft, 2) == 0:  # even nfft
-            SX = np.hstack([SX[0:int(nfft/2)], np.conj(SX[int(nfft/2)]), SX[int(nfft/2):nfft]])
-        if full == 1: # shift to -fN ~ 0 ~ fN
-            SX = np.fft.fftshift(SX)
-        else: # half 0 ~ fN
-            SX = SX[0:int(nfft/2+1)]
+    # get fft of all segments
+    if np.iscomplexobj(sx):
+        SX = fft(sx, n=nfft, axis=-1)/nfft  # divide by the length
+    else:
+        SX = rfft(sx, n=nfft, axis=-1)/nfft  # real input; 0 ~ fN
+        if full == 1: # negative frequencies by conjugate symmetry
+            SX = np.concatenate([SX, np.conj(SX[...,(nfft - SX.shape[-1]):0:-1])], axis=-1)
 
-        fftdata[b,:] = SX
+    fftdata = fft_layout(SX, nfft, full)
 
     return ax, fftdata, win_factor
 
 
-def cross_power(XX, YY, win_factor, bidx=0):
-    # calculate cross power
-    # IN : bins x faxis fftdata
-    if type(bidx) is int:
-        bidx = np.arange(len(XX))
+def fft_layout(SX, nfft, full):
+    # IN : ... x nfft fftdata of 0~fN -fN~-f1 (or ... x (nfft/2+1) of 0~fN for full = 0)
+    # OUT : ... x faxis fftdata; fN is duplicated for even nfft
+    if np.mod(nfft, 2) == 0:  # even nfft
+        SX = np.concatenate([SX[...,0:int(nfft/2)], np.conj(SX[...,int(nfft/2):int(nfft/2+1)]), SX[...,int(nfft/2):nfft]], axis=-1)
+    if full == 1: # shift to -fN ~ 0 ~ fN
+        SX = np.fft.fftshift(SX, axes=-1)
+    else: # half 0 ~ fN
+        SX = SX[...,0:int(nfft/2+1)]
 
-    val = np.zeros((len(bidx),XX.shape[1]), dtype=np.complex_)
+    return SX
 
-    for i,b in enumerate(bidx):
-        X = XX[b,:]
-        Y = YY[b,:]
 
-        val[i,:] = X*np.matrix.conjugate(Y) / win_factor
+def full_layout(SX):
+    # IN : ... x (nfft/2+1) fftdata of 0~fN of real time series
+    # OUT : ... x faxis fftdata of -fN ~ 0 ~ fN by conjugate symmetry
+    return np.concatenate([np.conj(SX[...,:0:-1]), SX], axis=-1)
 
-    # average over bins
-    Pxy = np.mean(val, 0)
-    Pxy = np.abs(Pxy).real
 
-    return Pxy
+def cross_spec(XX, YY, bidx=0):
+    # IN : bins x faxis fftdata or cnum x bins x faxis fftdata
+    # OUT : bin averages of X Y*, X X*, Y Y* and X Y*/|X||Y| (faxis or cnum x faxis)
+    if type(bidx) is int:
+        bidx = np.arange(XX.shape[-2])
 
+    X = XX[...,bidx,:]
+    Y = YY[...,bidx,:]
 
-def coherence(XX, YY, bidx=0):
-    if type(bidx) is int:
-        bidx = np.arange(len(XX))
+    Sxy = X*np.conj(Y)
+    Sxx = (X*np.conj(X)).real
+    Syy = (Y*np.conj(Y)).real
 
-    val = np.zeros((len(bidx),XX.shape[1]), dtype=np.complex_)
+    # average over bins
+    Pxy = np.mean(Sxy, -2)
+    Pxx = np.mean(Sxx, -2)
+    Pyy = np.mean(Syy, -2)
+    Gxy = np.mean(Sxy / np.sqrt(Sxx*Syy), -2)
+    # saturated data gives zero Pxx!!
+
+    return Pxy, Pxx, Pyy, Gxy
+
+
+class CrossSpec(object):
+    # running sums of cross spectra over bins; segment spectra are not kept
+    def __init__(self, cnum, nfreq):
+        self.n = 0  # number of bins
+        self.Sxy = np.zeros((cnum, nfreq), dtype=np.complex_)
+        self.Sxx = np.zeros((cnum, nfreq))
+        self.Syy = np.zeros((cnum, nfreq))
+        self.Gxy = np.zeros((cnum, nfreq), dtype=np.complex_)
+
+    def add(self, XX, YY):
+        # IN : cnum x bins x faxis fftdata (a single ref channel for all cmp channels)
+        Sxy = XX*np.conj(YY)
+        Sxx = (XX*np.conj(XX)).real
+        Syy = (YY*np.conj(YY)).real
+
+        self.n += YY.shape[1]
+        self.Sxy += np.sum(Sxy, 1)
+        self.Sxx += np.sum(Sxx, 1)
+        self.Syy += np.sum(Syy, 1)
+        self.Gxy += np.sum(Sxy / np.sqrt(Sxx*Syy), 1)
+
+    def mean(self):
+        # OUT : bin averages of X Y*, X X*, Y Y* and X Y*/|X||Y| as cross_spec
+        return self.Sxy/self.n, self.Sxx/self.n, self.Syy/self.n, self.Gxy/self.n
+
+    def merge(self, other):
+        # add the sums of other (associative); partial sums of windows, shots or nodes
+        # sums of different channels, frequency axes, windows or layouts are not merged (ValueError)
+        # frequency axes and window factors are compared with a tolerance (time axes of windows differ by rounding)
+        if self.Sxy.shape != other.Sxy.shape:
+            raise ValueError('CrossSpec of {} cannot be merged to {}'.format(other.Sxy.shape, self.Sxy.shape))
+        for attr in ['ax', 'win_factor', 'full']:
+            a, b = getattr(self, attr, None), getattr(other, attr, None)
+            if (a is None) != (b is None) or (a is not None and not np.allclose(a, b, rtol=1e-6, atol=0)):
+                raise ValueError('CrossSpec of different {} cannot be merged'.format(attr))
+
+        self.n += other.n
+        self.Sxy += other.Sxy
+        self.Sxx += other.Sxx
+        self.Syy += other.Syy
+        self.Gxy += other.Gxy
+
+        return self
+
+    def values(self):
+        # OUT : cross power, coherence and cross phase on ax
+        Pxy, _, _, Gxy = self.mean()
+
+        Cxy = np.abs(Pxy / self.win_factor).real
+        if self.full == 0:  # product 2 for half return
+            Cxy = 2*Cxy
+
+        return Cxy, np.abs(Gxy).real, np.arctan2(Pxy.imag, Pxy.real).real
+
+    def save(self, fname):
+        with open(fname, 'wb') as f:
+            pickle.dump(self, f)
+
+
+def load_cross_spec(fname):
+    with open(fname, 'rb') as f:
+        return pickle.load(f)
 
-    for i,b in enumerate(bidx):
-        X = XX[b,:]
-        Y = YY[b,:]
 
-        Pxx = X * np.matrix.conjugate(X)
-        Pyy = Y * np.matrix.conjugate(Y)
+def cross_power(XX, YY, win_factor, bidx=0):
+    # calculate cross power
+    # IN : bins x faxis fftdata
+    Pxy, _, _, _ = cross_spec(XX, YY, bidx)
+    Pxy = np.abs(Pxy / win_factor).real
 
-        val[i,:] = X*np.matrix.conjugate(Y) / np.sqrt(Pxx*Pyy)
-        # saturated data gives zero Pxx!!
+    return Pxy
 
-    # average over bins
-    Gxy = np.mean(val, 0)
+
+def coherence(XX, YY, bidx=0):
+    _, _, _, Gxy = cross_spec(XX, YY, bidx)
     Gxy = np.abs(Gxy).real
 
     return Gxy
 
 
 def cross_phase(XX, YY, bidx=0):
-    if type(bidx) is int:
-        bidx = np.arange(len(XX))
-
-    val = np.zeros((len(bidx),XX.shape[1]), dtype=np.complex_)
-
-    for i,b in enumerate(bidx):
-        X = XX[b,:]
-        Y = YY[b,:]
-
-        val[i,:] = X*np.matrix.conjugate(Y)
-
-    # average over bins
-    Pxy = np.mean(val, 0)
+    Pxy, _, _, _ = cross_spec(XX, YY, bidx)
     # result saved in val
     Axy = np.arctan2(Pxy.imag, Pxy.real).real
 
@@ -162,51 +330,64 @@ def xspec(XX, YY, win_factor):
     return val
 
 
-def bicoherence(XX, YY, bidx=0):
+def bicoherence(XX, YY, bidx=0, roi=None):
     # ax1 = self.Dlist[dtwo].ax # full -fN ~ fN
     # ax2 = np.fft.ifftshift(self.Dlist[dtwo].ax) # full 0 ~ fN, -fN ~ -f1
     # ax2 = ax2[0:int(nfft/2+1)] # half 0 ~ fN
+    # val[i,j] for f1 = ax1[i], f2 = ax2[j], f3 = f1 + f2 = ax1[i+j]
     if type(bidx) is int:
         bidx = np.arange(len(XX))
     full = len(XX[0,:]) # full length
     half = int(full/2+1) # half length
+    c = full - half # index of f = 0
+
+    # region of interest; (f1, f2) pairs with f2 >= 0
+    if roi is not None:
+        return bicoherence_roi(XX, YY, bidx, roi)
+
+    # auto bicoherence is symmetric in f1 and f2 (f1, f2 >= 0)
+    auto = XX is YY
+
+    # f1 + f2 index map
+    idx3 = np.arange(full)[:,np.newaxis] + np.arange(half)[np.newaxis,:]
+    in3 = idx3 < full
 
     # calculate bicoherence
     B = np.zeros((full, half), dtype=np.complex_)
     P12 = np.zeros((full, half))
-    P3 = np.zeros((full, half))
-    val = np.zeros((full, half))
-
-    for b in bidx:
-        X = XX[b,:] # full -fN ~ fN
-        Y = YY[b,:] # full -fN ~ fN
+    Py = np.zeros(full)
 
-        Xhalf = np.fft.ifftshift(X) # full 0 ~ fN, -fN ~ -f1
-        Xhalf = Xhalf[0:half] # half 0 ~ fN
+    # chunks of bins; temporaries of bstep x full
+    bstep = chunk_size(4*full)
+    for b1 in range(0, len(bidx), bstep):
+        X = XX[bidx[b1:(b1 + bstep)],:] # full -fN ~ fN
+        Y = YY[bidx[b1:(b1 + bstep)],:] # full -fN ~ fN
+        X2 = X[:,c:] # half 0 ~ fN
 
-        X1 = np.transpose(np.tile(X, (half, 1)))
-        X2 = np.tile(Xhalf, (full, 1))
-        X3 = np.zeros((full, half), dtype=np.complex_)
         for j in range(half):
-            if j == 0:
-                X3[0:, j] = Y[j:]
+            # rows with f3 in range; auto bicoherence only for f1 < 0 or f1 >= f2
+            if auto:
+                rows = np.r_[0:min(c, full - j), (c + j):(full - j)]
             else:
-                X3[0:(-j), j] = Y[j:]
+                rows = np.arange(full - j)
+            B[rows,j] += np.dot(X2[:,j], X[:,rows]*np.conj(Y[:,rows + j])) # complex bin average
 
-        B = B + X1 * X2 * np.matrix.conjugate(X3) #  complex bin average
-        P12 = P12 + (np.abs(X1 * X2).real)**2 # real average
-        P3 = P3 + (np.abs(X3).real)**2 # real average
+        Ax = (np.abs(X).real)**2
+        P12 += np.dot(Ax.T, Ax[:,c:]) # real average
+        Py += np.sum((np.abs(Y).real)**2, 0) # real average
+
+    if auto:
+        for j in range(1, half):
+            B[c:(c + j),j] = B[c + j,0:j]
+
+    P3 = np.zeros((full, half))
+    P3[in3] = Py[idx3[in3]]
 
     # val = np.log10(np.abs(B)**2) # bispectrum
     val = (np.abs(B)**2) / P12 / P3 # bicoherence
 
     # summation over pairs
-    sum_val = np.zeros(full)
-    for i in range(half):
-        if i == 0:
-            sum_val = sum_val + val[:,i]
-        else:
-            sum_val[i:] = sum_val[i:] + val[:-i,i]
+    sum_val = np.bincount(idx3[in3], weights=val[in3], minlength=full)
 
     N = np.array([i+1 for i in range(half)] + [half for i in range(full-half)])
     sum_val = sum_val / N # element wise division
@@ -214,136 +395,169 @@ def bicoherence(XX, YY, bidx=0):
     return val, sum_val
 
 
-def ritz_nonlinear(XX, YY):
-    # calculate
-    bins = len(XX)
+def bicoherence_roi(XX, YY, bidx, roi):
+    # IN : roi (i1, i2) index arrays of f1 and f2 on the full axis (-fN ~ fN)
+    # OUT : val (NaN out of roi) and sum_val (average over the pairs in roi) same as bicoherence
     full = len(XX[0,:]) # full length
+    half = int(full/2+1) # half length
+    c = full - half # index of f = 0
 
-    kidx = get_kidx(full)
+    # rows and columns of the pairs; each pair once
+    i1, j2 = np.asarray(roi[0]), np.asarray(roi[1]) - c
+    good = (j2 >= 0) & (i1 + j2 < full)
+    i1, j2 = np.unique(np.stack((i1[good], j2[good])), axis=1)
+    i3 = i1 + j2
 
-    Aijk = np.zeros((full, full), dtype=np.complex_) # Xo1 Xo2 cXo
-    cAijk = np.zeros((full, full), dtype=np.complex_) # cXo1 cXo2 Xo
-    Bijk = np.zeros((full, full), dtype=np.complex_) # Yo cXo1 cXo2
-    Aij = np.zeros((full, full)) # |Xo1 Xo2|^2
+    B = np.zeros(len(i1), dtype=np.complex_)
+    P12 = np.zeros(len(i1))
+    P3 = np.zeros(len(i1))
 
-    Ak = np.zeros(full) # Xo cXo
-    Bk = np.zeros(full, dtype=np.complex_) # Yo cXo
+    # chunks of bins; temporaries of bstep x pairs
+    bstep = chunk_size(4*len(i1))
+    for b1 in range(0, len(bidx), bstep):
+        X = XX[bidx[b1:(b1 + bstep)],:] # full -fN ~ fN
+        Y = YY[bidx[b1:(b1 + bstep)],:] # full -fN ~ fN
 
-    for b in range(bins):
-        X = XX[b,:] # full -fN ~ fN
-        Y = YY[b,:] # full -fN ~ fN
+        B += np.sum(X[:,i1] * X[:,c + j2] * np.conj(Y[:,i3]), 0) # complex bin average
+        P12 += np.sum((np.abs(X[:,i1] * X[:,c + j2]).real)**2, 0) # real average
+        P3 += np.sum((np.abs(Y[:,i3]).real)**2, 0) # real average
 
-        # make Xi and Xj
-        Xi = np.transpose(np.tile(X, (full, 1))) # columns of (-fN ~ fN)
-        Xj = np.tile(X, (full, 1)) # rows of (-fN ~ fN)
+    val = np.zeros((full, half)) * np.nan
+    val[i1,j2] = (np.abs(B)**2) / P12 / P3 # bicoherence
 
-        # make Xk and Yk
-        Xk = np.zeros((full, full), dtype=np.complex_)
-        Yk = np.zeros((full, full), dtype=np.complex_)
-        for k in range(full):
-            idx = kidx[k]
-            for n, ij in enumerate(idx):
-                Xk[ij] = X[k]
-                Yk[ij] = Y[k]
+    # summation over pairs in roi
+    sum_val = np.bincount(i3, weights=val[i1,j2], minlength=full).astype(np.float64)
+    N = np.bincount(i3, minlength=full)
+    sum_val[N > 0] = sum_val[N > 0] / N[N > 0]
+    sum_val[N == 0] = np.nan
 
-        # do ensemble average
-        Aijk = Aijk + Xi * Xj * np.matrix.conjugate(Xk) / bins
+    return val, sum_val
 
-        cAijk = cAijk + np.matrix.conjugate(Xi) * np.matrix.conjugate(Xj) * Xk / bins
 
-        Bijk = Bijk + np.matrix.conjugate(Xi) * np.matrix.conjugate(Xj) * Yk / bins
+def roi_index(ax, f1range=None, f2range=None, triads=None):
+    # IN : full frequency axis (-fN ~ fN), [f1 min, f1 max] and [f2 min, f2 max], or list of (f1, f2) triads (f3 = f1 + f2)
+    # OUT : (i1, i2) index arrays of f1 and f2 on ax (each pair once); None for the full plane
+    if triads is not None:
+        # triads out of the frequency axis are dropped
+        tri = np.array(triads, dtype=np.float64).reshape((-1, 2))
+        df = ax[1] - ax[0]
+        good = np.all((tri >= ax[0] - df/2.0) & (tri <= ax[-1] + df/2.0), 1)
+        if not np.all(good):
+            print('#### {:d} triads out of [{:g}, {:g}] are dropped ####'.format(int(np.sum(~good)), ax[0], ax[-1]))
+        tri = tri[good,:]
+        i1 = np.argmin(np.abs(ax[np.newaxis,:] - tri[:,0:1]), 1)
+        i2 = np.argmin(np.abs(ax[np.newaxis,:] - tri[:,1:2]), 1)
+    elif f1range is not None or f2range is not None:
+        if f1range is None: f1range = [ax[0], ax[-1]]
+        if f2range is None: f2range = [ax[0], ax[-1]]
+        idx1 = np.where((ax >= f1range[0]) & (ax <= f1range[1]))[0]
+        idx2 = np.where((ax >= f2range[0]) & (ax <= f2range[1]))[0]
+        i1, i2 = np.meshgrid(idx1, idx2, indexing='ij')
+        i1, i2 = i1.ravel(), i2.ravel()
+    else:
+        return None
+
+    i1, i2 = np.unique(np.stack((i1, i2)), axis=1)
+
+    return i1, i2
+
+
+def ritz_nonlinear(XX, YY, roi=None):
+    # roi : (i1, i2) index arrays of f1 and f2 on the full axis; quadratic terms only for these pairs
+    # calculate
+    bins = len(XX)
+    full = len(XX[0,:]) # full length
 
-        Aij = Aij + (np.abs(Xi * Xj).real)**2 / bins
+    pi, pj, pk = get_pairs(full, roi)
 
-        Ak = Ak + (np.abs(X).real)**2 / bins
+    Aijk = np.zeros(len(pk), dtype=np.complex_) # Xo1 Xo2 cXo
+    cAijk = np.zeros(len(pk), dtype=np.complex_) # cXo1 cXo2 Xo
+    Bijk = np.zeros(len(pk), dtype=np.complex_) # Yo cXo1 cXo2
+    Aij = np.zeros(len(pk)) # |Xo1 Xo2|^2
 
-        Bk = Bk + Y * np.matrix.conjugate(X) / bins
+    # chunks of bins; temporaries of bstep x pairs
+    bstep = chunk_size(4*len(pk))
+    for b1 in range(0, bins, bstep):
+        X = XX[b1:(b1 + bstep),:] # full -fN ~ fN
+        Y = YY[b1:(b1 + bstep),:] # full -fN ~ fN
 
-    # Linear transfer function ~ growth rate
-    Lk = np.zeros(full, dtype=np.complex_)
+        Xij = X[:,pi] * X[:,pj]
 
+        # do ensemble average
+        Aijk += np.sum(Xij * np.conj(X[:,pk]), 0) / bins
+        cAijk += np.sum(np.conj(Xij) * X[:,pk], 0) / bins
+        Bijk += np.sum(np.conj(Xij) * Y[:,pk], 0) / bins
+        Aij += np.sum((np.abs(Xij).real)**2, 0) / bins
+
+    Ak = np.mean((np.abs(XX).real)**2, 0) # Xo cXo
+    Bk = np.mean(YY * np.conj(XX), 0) # Yo cXo
+
+    # Linear transfer function ~ growth rate
     bsum = np.zeros(full, dtype=np.complex_)
     asum = np.zeros(full)
-    for k in range(full):
-        idx = kidx[k]
-        for n, ij in enumerate(idx):
-            bsum[k] = bsum[k] + Aijk[ij] * Bijk[ij] / Aij[ij]
-            asum[k] = asum[k] + (np.abs(Aijk[ij]).real)**2 / Aij[ij]
+    np.add.at(bsum, pk, Aijk * Bijk / Aij)
+    np.add.at(asum, pk, (np.abs(Aijk).real)**2 / Aij)
 
     Lk = (Bk - bsum) / (Ak - asum)
 
     # Quadratic transfer function ~ nonlinear energy transfer rate
-    Lkk = np.zeros((full, full), dtype=np.complex_)
-    for k in range(full):
-        idx = kidx[k]
-        for n, ij in enumerate(idx):
-            Lkk[ij] = Lk[k]
-
-    Qijk = (Bijk - Lkk * cAijk) / Aij
+    Qijk = np.zeros((full, full), dtype=np.complex_)
+    Qijk[pi,pj] = (Bijk - Lk[pk] * cAijk) / Aij
 
-    return Lk, Qijk, Bk, Aijk
+    return Lk, Qijk, Bk, pair_plane(Aijk, pi, pj, full)
 
 
-def wit_nonlinear(XX, YY, bidx=0):
+def wit_nonlinear(XX, YY, bidx=0, roi=None):
+    # roi : (i1, i2) index arrays of f1 and f2 on the full axis; quadratic terms only for these pairs
     # calculate
     if type(bidx) is int:
         bidx = np.arange(len(XX))
     bins = len(bidx)
     full = len(XX[0,:]) # full length
 
-    kidx = get_kidx(full)
+    pi, pj, pk = get_pairs(full, roi)
+    kcut = np.searchsorted(pk, np.arange(full + 1)) # pairs of k in kcut[k]:kcut[k+1]
 
     Lk = np.zeros(full, dtype=np.complex_) # Linear
     Qijk = np.zeros((full, full), dtype=np.complex_) # Quadratic
 
+    X = XX[bidx,:] # full -fN ~ fN
+    Y = YY[bidx,:] # full -fN ~ fN
+
     print('For stable calculations, bins ({0}) >> full/2 ({1})'.format(bins, full/2))
     for k in range(full):
-        idx = kidx[k]
+        pidx = np.arange(kcut[k], kcut[k+1])
 
         # construct equations for each k
-        U = np.zeros((bins, len(idx)+1), dtype=np.complex_)  # N (number of ensembles) x P (number of pairs + 1)
-        V = np.zeros(bins, dtype=np.complex_) # N x 1
-
-        for i,b in enumerate(bidx):
-
-            U[i,0] = XX[b,k]
-            for n, ij in enumerate(idx):
-                U[i,n+1] = XX[b, ij[0]]*XX[b, ij[1]]
-
-            V[i] = YY[b,k]
+        # N (number of ensembles) x P (number of pairs + 1)
+        U = np.concatenate((X[:,k:(k+1)], X[:,pi[pidx]]*X[:,pj[pidx]]), 1)
+        V = Y[:,k] # N x 1
 
         # solution for each k
         H = np.matmul(np.linalg.pinv(U), V)
 
         Lk[k] = H[0]
-        for n, ij in enumerate(idx):
-            Qijk[ij] = H[n+1]
+        Qijk[pi[pidx],pj[pidx]] = H[1:]
 
     # calculate others for the rates
-    Aijk = np.zeros((full, full), dtype=np.complex_) # Xo1 Xo2 cXo
-    Bk = np.zeros(full, dtype=np.complex_) # Yo cXo
+    Aijk = np.zeros(len(pk), dtype=np.complex_) # Xo1 Xo2 cXo
 
-    # print('DO NOT CALCULATE RATES')
-    for b in bidx:
-        X = XX[b,:] # full -fN ~ fN
-        Y = YY[b,:] # full -fN ~ fN
+    # chunks of bins; temporaries of bstep x pairs
+    bstep = chunk_size(4*len(pk))
+    for b1 in range(0, bins, bstep):
+        Xb = X[b1:(b1 + bstep),:]
+        Aijk += np.sum(Xb[:,pi] * Xb[:,pj] * np.conj(Xb[:,pk]), 0) / bins # do ensemble average
+    Bk = np.mean(Y * np.conj(X), 0) # Yo cXo
 
-        # make Xi and Xj
-        Xi = np.transpose(np.tile(X, (full, 1))) # columns of (-fN ~ fN)
-        Xj = np.tile(X, (full, 1)) # rows of (-fN ~ fN)
+    return Lk, Qijk, Bk, pair_plane(Aijk, pi, pj, full)
 
-        # make Xk and Yk
-        Xk = np.zeros((full, full), dtype=np.complex_)
-        for k in range(full):
-            idx = kidx[k]
-            for n, ij in enumerate(idx):
-                Xk[ij] = X[k]
 
-        # do ensemble average
-        Aijk = Aijk + Xi * Xj * np.matrix.conjugate(Xk) / bins
-        Bk = Bk + Y * np.matrix.conjugate(X) / bins
+def pair_plane(Aijk, pi, pj, full):
+    # OUT : full x full plane of the pair values (zero out of the pairs)
+    A = np.zeros((full, full), dtype=Aijk.dtype)
+    A[pi,pj] = Aijk
 
-    return Lk, Qijk, Bk, Aijk
+    return A
 
 
 def nonlinear_rates(Lk, Qijk, Bk, Aijk, dt):
@@ -473,3 +687,22 @@ def get_kidx(full):
         kidx.append(idx)
 
     return kidx
+
+
+def get_pairs(full, roi=None):
+    # IN : full length, roi (i1, i2) index arrays on the full axis (None for all pairs)
+    # OUT : (i, j) index arrays of the pairs (i <= j) and k index array of f3 = fi + fj, ordered as get_kidx
+    c = int(full/2) # index of f = 0
+    if roi is None:
+        kidx = get_kidx(full)
+        pi = np.array([ij[0] for idx in kidx for ij in idx], dtype=np.int64)
+        pj = np.array([ij[1] for idx in kidx for ij in idx], dtype=np.int64)
+    else:
+        pi = np.minimum(roi[0], roi[1])
+        pj = np.maximum(roi[0], roi[1])
+        pk = pi + pj - c
+        good = (pk >= 0) & (pk < full)
+        pij = np.unique(np.stack((pk[good], -pj[good], pi[good])), axis=1) # no duplicates, ordered as get_kidx
+        pi, pj = pij[2], -pij[1]
+
+    return pi, pj, pi + pj - c
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# modules of the repository are flat at the top level
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('MDSplus')
+pytest.importorskip('h5py')
+
+import matplotlib
+matplotlib.use('Agg')
+
+from fluctana import FluctAna, FluctData
+
+
+def plane_wave(rpos, zpos, f0=20e3, k0=0.5, fs=500e3, tnum=20000, seed=0):
+    # cos(2 pi f0 t - k0 s) with s along R (or z) [cm]
+    rng = np.random.default_rng(seed)
+    time = np.arange(tnum)/fs
+    s = (rpos if np.ptp(rpos) > 0 else zpos)*100
+    data = np.cos(2*np.pi*f0*time[np.newaxis,:] - k0*s[:,np.newaxis]) + 0.1*rng.standard_normal((len(s), tnum))
+
+    D = FluctData(1, ['C{:d}'.format(i) for i in range(len(s))], time, data, rpos, zpos, np.zeros(len(s)))
+    D.fs = fs
+
+    return D
+
+
+@pytest.mark.parametrize('method', ['fft', 'bartlett'])
+@pytest.mark.parametrize('row', [True, False])
+def test_kf_spec_channel_order(method, row):
+    pos = 1.8 + np.arange(8)*0.01
+    if row:
+        D = plane_wave(pos, np.zeros(8))
+    else:
+        D = plane_wave(np.ones(8)*1.8, pos - 1.8)
+
+    kpeak = []
+    for cnl in [range(8), range(8)[::-1]]:
+        A = FluctAna()
+        A.Dlist.append(D)
+        A.fftbins(nfft=512, window='hann', overlap=0.5, detrend=0, full=1)
+        A.kf_spec(0, cnl=list(cnl), method=method, verbose=0)
+
+        fidx = np.argmin(np.abs(D.ax - 20e3))
+        kpeak.append(D.kax[np.argmax(D.val[:,fidx])])
+
+    # k > 0 for a wave propagating to larger R (z), independent of the channel order
+    assert abs(kpeak[0] - kpeak[1]) < 1e-9
+    assert abs(kpeak[0] - 0.5) < 0.02
+
+
+def ref_correlation(D1, D2, coef):
+    # loops over channels and bins of the ifft of each bin (full fftbins, rnum = cnum)
+    nfft = D2.nfft
+    val = np.zeros((len(D2.data), nfft))
+    for c in range(len(D2.data)):
+        cval = np.zeros((D2.bins, nfft), dtype=complex)
+        for b in range(D2.bins):
+            X = D1.spdata[c,b,:]
+            Y = D2.spdata[c,b,:]
+            cval[b,:] = np.fft.fftshift(np.fft.ifft(np.fft.ifftshift(X*np.conj(Y) / D2.win_factor), n=nfft)*nfft)
+            if coef:
+                x = np.fft.ifft(np.fft.ifftshift(X), n=nfft)*nfft/np.sqrt(D2.win_factor)
+                y = np.fft.ifft(np.fft.ifftshift(Y), n=nfft)*nfft/np.sqrt(D2.win_factor)
+                cval[b,:] = cval[b,:]/np.sqrt(np.mean(x**2)*np.mean(y**2))
+        val[c,:] = np.mean(cval, 0).real
+
+    return val
+
+
+@pytest.mark.parametrize('coef', [False, True])
+def test_correlation(coef):
+    A = FluctAna()
+    A.Dlist.append(plane_wave(1.8 + np.arange(4)*0.01, np.zeros(4), seed=1))
+    A.Dlist.append(plane_wave(1.8 + np.arange(4)*0.01 + 0.005, np.zeros(4), seed=2))
+    A.fftbins(nfft=256, window='hann', overlap=0.5, detrend=0, full=1)
+
+    ref = ref_correlation(A.Dlist[0], A.Dlist[1], coef)
+    if coef:
+        A.corr_coef(0, 1)
+    else:
+        A.correlation(0, 1)
+
+    assert np.allclose(A.Dlist[1].val, ref, rtol=1e-10, atol=1e-12)
+
+
+@pytest.mark.parametrize('ftype', ['cheby1', 'cheby2', 'ellip'])
+def test_filt_ripple(ftype):
+    from scipy import signal
+
+    D = plane_wave(1.8 + np.arange(2)*0.01, np.zeros(2))
+    raw = D.data.copy()
+    A = FluctAna()
+    A.Dlist.append(D)
+    A.filt(0, 'IIR_pass', 10000, 30000, ftype=ftype, order=4, rp=1, rs=40)
+
+    sos = signal.iirfilter(4, [10000, 30000], rp=1, rs=40, btype='bandpass', ftype=ftype, output='sos', fs=D.fs)
+    assert np.allclose(D.data, signal.sosfiltfilt(sos, raw, axis=1), rtol=1e-10, atol=1e-12)
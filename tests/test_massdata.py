@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+from scipy.interpolate import griddata
+
+import massdata as ms
+
+
+def ecei_positions(seed=0):
+    # 24 x 8 channels on a slightly distorted grid [m]
+    rng = np.random.default_rng(seed)
+    zpos, rpos = np.meshgrid(np.linspace(-0.2, 0.2, 24), np.linspace(1.8, 1.95, 8), indexing='ij')
+    rpos = rpos.ravel() + 0.002*rng.standard_normal(192)
+    zpos = zpos.ravel() + 0.002*rng.standard_normal(192)
+
+    return rpos, zpos
+
+
+def ref_fill_bad_channel(pdata, rpos, zpos, good_channels, cutoff):
+    # loop over bad channels of a frame
+    pdata = pdata.copy()
+    pdata[np.isnan(pdata)] = 0
+    for c in range(pdata.size):
+        if good_channels[c] == 0:
+            dist = np.sqrt((rpos - rpos[c])**2 + (zpos - zpos[c])**2)
+            dfct = np.exp(-2*(dist/cutoff)**4) * good_channels
+            pdata[c] = np.sum(pdata * dfct)/np.sum(dfct)
+
+    return pdata
+
+
+def test_fill_bad_channel():
+    rpos, zpos = ecei_positions()
+    rng = np.random.default_rng(1)
+    good_channels = np.ones(192)
+    good_channels[rng.choice(192, 20, replace=False)] = 0
+    pdata = rng.standard_normal((192, 5))
+    pdata[3,2] = np.nan
+
+    filled = ms.fill_bad_channel(pdata.copy(), rpos, zpos, good_channels, 0.03)
+    for i in range(5):
+        ref = ref_fill_bad_channel(pdata[:,i], rpos, zpos, good_channels, 0.03)
+        assert np.allclose(filled[:,i], ref, rtol=1e-12, atol=1e-14)
+        assert np.allclose(ms.fill_bad_channel(pdata[:,i].copy(), rpos, zpos, good_channels, 0.03), ref, rtol=1e-12, atol=1e-14)
+
+
+@pytest.mark.parametrize('imethod, tol', [('linear', 1e-12), ('nearest', 0), ('cubic', 1e-7)])
+def test_interp_pdata(imethod, tol):
+    rpos, zpos = ecei_positions()
+    rng = np.random.default_rng(2)
+    pdata = rng.standard_normal((192, 3))
+
+    ri, zi, pi = ms.interp_pdata(pdata, rpos, zpos, 0.005, imethod)
+    for i in range(3):
+        ref = griddata((rpos, zpos), pdata[:,i], (ri, zi), method=imethod)
+        assert np.array_equal(np.isnan(pi[i]), np.isnan(ref))
+        assert np.allclose(pi[i], ref, rtol=0, atol=tol, equal_nan=True)
+
+    # a single frame
+    _, _, pi1 = ms.interp_pdata(pdata[:,0], rpos, zpos, 0.005, imethod)
+    assert np.allclose(pi1, pi[0], rtol=0, atol=1e-14, equal_nan=True)
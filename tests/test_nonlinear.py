@@ -0,0 +1,154 @@
+import numpy as np
+import pytest
+
+import specs as sp
+
+# reference loops of the definitions on small synthetic fftdata (bins x full, -fN ~ fN)
+
+FULL = 17
+BINS = 60
+
+
+def ref_bicoherence(XX, YY, bidx):
+    full = XX.shape[1]
+    half = int(full/2+1)
+    c = full - half
+
+    B = np.zeros((full, half), dtype=complex)
+    P12 = np.zeros((full, half))
+    P3 = np.zeros((full, half))
+    for b in bidx:
+        for i in range(full):
+            for j in range(half):
+                if i + j < full:
+                    X3 = YY[b,i+j]
+                else:
+                    X3 = 0
+                B[i,j] += XX[b,i]*XX[b,c+j]*np.conj(X3)
+                P12[i,j] += np.abs(XX[b,i]*XX[b,c+j])**2
+                P3[i,j] += np.abs(X3)**2
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        val = np.abs(B)**2 / P12 / P3
+
+    sum_val = np.zeros(full)
+    N = np.zeros(full)
+    for i in range(full):
+        for j in range(half):
+            if i + j < full:
+                sum_val[i+j] += val[i,j]
+                N[i+j] += 1
+
+    return val, sum_val / N
+
+
+def ref_pairs(full):
+    c = int(full/2)
+    return [(i, j, i + j - c) for i in range(full) for j in range(i, full) if 0 <= i + j - c < full]
+
+
+def ref_ritz(XX, YY):
+    bins, full = XX.shape
+    pairs = ref_pairs(full)
+
+    Ak = np.mean(np.abs(XX)**2, 0)
+    Bk = np.mean(YY*np.conj(XX), 0)
+    A = {}
+    for i, j, k in pairs:
+        Aijk = np.mean(XX[:,i]*XX[:,j]*np.conj(XX[:,k]))
+        Bijk = np.mean(np.conj(XX[:,i]*XX[:,j])*YY[:,k])
+        Aij = np.mean(np.abs(XX[:,i]*XX[:,j])**2)
+        A[(i, j)] = (Aijk, Bijk, Aij)
+
+    bsum = np.zeros(full, dtype=complex)
+    asum = np.zeros(full)
+    for i, j, k in pairs:
+        Aijk, Bijk, Aij = A[(i, j)]
+        bsum[k] += Aijk*Bijk/Aij
+        asum[k] += np.abs(Aijk)**2/Aij
+    Lk = (Bk - bsum) / (Ak - asum)
+
+    Qijk = np.zeros((full, full), dtype=complex)
+    Aijk_plane = np.zeros((full, full), dtype=complex)
+    for i, j, k in pairs:
+        Aijk, Bijk, Aij = A[(i, j)]
+        Qijk[i,j] = (Bijk - Lk[k]*np.conj(Aijk)) / Aij
+        Aijk_plane[i,j] = Aijk
+
+    return Lk, Qijk, Bk, Aijk_plane
+
+
+def ref_wit(XX, YY, bidx):
+    full = XX.shape[1]
+    pairs = ref_pairs(full)
+    X = XX[bidx,:]
+    Y = YY[bidx,:]
+
+    Lk = np.zeros(full, dtype=complex)
+    Qijk = np.zeros((full, full), dtype=complex)
+    for k in range(full):
+        pk = [(i, j) for i, j, kk in pairs if kk == k]
+        U = np.array([[X[b,k]] + [X[b,i]*X[b,j] for i, j in pk] for b in range(len(bidx))])
+        H = np.dot(np.linalg.pinv(U), Y[:,k])
+        Lk[k] = H[0]
+        for n, (i, j) in enumerate(pk):
+            Qijk[i,j] = H[n+1]
+
+    Bk = np.mean(Y*np.conj(X), 0)
+    Aijk = np.zeros((full, full), dtype=complex)
+    for i, j, k in pairs:
+        Aijk[i,j] = np.mean(X[:,i]*X[:,j]*np.conj(X[:,k]))
+
+    return Lk, Qijk, Bk, Aijk
+
+
+def random_fftdata(seed):
+    rng = np.random.default_rng(seed)
+    return rng.standard_normal((BINS, FULL)) + 1j*rng.standard_normal((BINS, FULL))
+
+
+@pytest.mark.parametrize('auto', [True, False])
+@pytest.mark.parametrize('bidx', [0, np.arange(5, 50)])
+def test_bicoherence(auto, bidx):
+    XX = random_fftdata(0)
+    YY = XX if auto else random_fftdata(1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        val, sum_val = sp.bicoherence(XX, YY, bidx)
+    rval, rsum_val = ref_bicoherence(XX, YY, np.arange(BINS) if type(bidx) is int else bidx)
+
+    assert np.array_equal(np.isnan(val), np.isnan(rval))
+    assert np.allclose(val, rval, rtol=1e-10, atol=1e-14, equal_nan=True)
+    assert np.allclose(sum_val, rsum_val, rtol=1e-10, atol=1e-14)
+
+
+def test_ritz_nonlinear():
+    XX = random_fftdata(2)
+    YY = random_fftdata(3)
+
+    for v, rv in zip(sp.ritz_nonlinear(XX, YY), ref_ritz(XX, YY)):
+        assert np.allclose(v, rv, rtol=1e-10, atol=1e-14)
+
+
+def test_wit_nonlinear():
+    XX = random_fftdata(4)
+    YY = random_fftdata(5)
+    bidx = np.arange(3, 57)
+
+    for v, rv in zip(sp.wit_nonlinear(XX, YY, bidx), ref_wit(XX, YY, bidx)):
+        assert np.allclose(v, rv, rtol=1e-8, atol=1e-12)
+
+
+def test_small_chunks(monkeypatch):
+    XX = random_fftdata(6)
+    YY = random_fftdata(7)
+    bidx = np.arange(3, 57)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ref = [sp.bicoherence(XX, YY, 0), sp.ritz_nonlinear(XX, YY), sp.wit_nonlinear(XX, YY, bidx)]
+        monkeypatch.setattr(sp, 'CHUNK_POINTS', 256)
+        out = [sp.bicoherence(XX, YY, 0), sp.ritz_nonlinear(XX, YY), sp.wit_nonlinear(XX, YY, bidx)]
+
+    for vv, rv in zip(out, ref):
+        for v, r in zip(vv, rv):
+            assert np.allclose(v, r, rtol=1e-10, atol=1e-14, equal_nan=True)
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+import specs as sp
+
+
+def cross_spec_of(x, y, dt=1e-6, nfft=256, window='hann'):
+    ax, XX, win_factor = sp.fftbins(x, dt, nfft, window, 0.5, 0, 0)
+    _, YY, _ = sp.fftbins(y, dt, nfft, window, 0.5, 0, 0)
+
+    acc = sp.CrossSpec(len(y), XX.shape[-1])
+    acc.add(XX, YY)
+    acc.ax = ax
+    acc.win_factor = win_factor
+    acc.full = 0
+
+    return acc
+
+
+def test_cross_spec_merge():
+    rng = np.random.default_rng(0)
+    x = rng.standard_normal((2, 8192))
+    y = rng.standard_normal((2, 8192))
+
+    acc = cross_spec_of(x[:,:4096], y[:,:4096])
+    acc.merge(cross_spec_of(x[:,4096:], y[:,4096:]))
+    ref = cross_spec_of(x[:,:4096], y[:,:4096])
+    _, XX, _ = sp.fftbins(x[:,4096:], 1e-6, 256, 'hann', 0.5, 0, 0)
+    _, YY, _ = sp.fftbins(y[:,4096:], 1e-6, 256, 'hann', 0.5, 0, 0)
+    ref.add(XX, YY)
+
+    assert acc.n == ref.n
+    assert np.allclose(acc.Sxy, ref.Sxy)
+
+
+def test_cross_spec_merge_rounded_dt():
+    # time axes of windows made by np.arange(ti, t1, 1/fs) give dt different by rounding
+    rng = np.random.default_rng(3)
+    x = rng.standard_normal((2, 4096))
+    y = rng.standard_normal((2, 4096))
+
+    fs = 2e6
+    t1 = np.arange(1.0, 1.01, 1/fs)
+    t2 = np.arange(5.3, 5.31, 1/fs)
+    dt1, dt2 = t1[1] - t1[0], t2[1] - t2[0]
+    assert dt1 != dt2
+
+    acc = cross_spec_of(x, y, dt=dt1)
+    acc.merge(cross_spec_of(x, y, dt=dt2))
+    assert acc.n == 2*cross_spec_of(x, y).n
+
+
+@pytest.mark.parametrize('kwargs', [{'nfft':128}, {'dt':2e-6}, {'window':'hamm'}])
+def test_cross_spec_merge_mismatch(kwargs):
+    rng = np.random.default_rng(1)
+    x = rng.standard_normal((2, 4096))
+    y = rng.standard_normal((2, 4096))
+
+    acc = cross_spec_of(x, y)
+    with pytest.raises(ValueError):
+        acc.merge(cross_spec_of(x, y, **kwargs))
+    assert acc.n == cross_spec_of(x, y).n
+
+
+def test_roi_index_triads():
+    ax = (np.arange(33) - 16)*1e3
+
+    # duplicates once, out of the axis dropped
+    i1, i2 = sp.roi_index(ax, triads=[(3e3, 4e3), (3e3, 4e3), (50e3, 1e3)])
+    assert list(zip(ax[i1], ax[i2])) == [(3e3, 4e3)]
+
+    rng = np.random.default_rng(2)
+    XX = rng.standard_normal((20, 33)) + 1j*rng.standard_normal((20, 33))
+    val, sum_val = sp.bicoherence(XX, XX, 0)
+    rval, rsum_val = sp.bicoherence(XX, XX, 0, roi=(np.r_[i1, i1], np.r_[i2, i2]))
+    k = i1[0] + i2[0] - 16
+    assert np.isclose(rsum_val[k], val[i1[0], i2[0] - 16])